@@ -5,19 +5,24 @@
 # Based on Raibatak Das / created: Nov 2016 / modified: Dec 2016
 
 import numpy as np
-import matplotlib.pyplot as plt
-import os
 
-colorizer = __import__('2D_visualization_v1').colorizer
-stepwise_transform = __import__('2D_visualization_v1').stepwise_transform
-static_plot = __import__('2D_visualization_v1').static_plot
-intermediate_plots = __import__('2D_visualization_v1').intermediate_plots
+import analysis
+from animation_encoder import AnimationWriter, global_palette
+from frame_cache import FrameCache
+from grids import rectilinear_grid
+from transform_engine import iter_transform, transform_max
+
+colorizer = __import__('2D_visualization_v01').colorizer
+stepwise_transform = __import__('2D_visualization_v01').stepwise_transform
+static_plot = __import__('2D_visualization_v01').static_plot
+intermediate_plots = __import__('2D_visualization_v01').intermediate_plots
 
 if __name__ == '__main__':
     # grid of points in x-y space
     xvals = np.linspace(-4, 4, 9)
     yvals = np.linspace(-4, 4, 9)
-    xygrid = np.column_stack([[x, y] for x in xvals for y in yvals])
+    # float32 is far more precise than the pixels of the frames
+    xygrid = rectilinear_grid(xvals, yvals, dtype=np.float32)
 
     # linear transformation
     A = np.array([[3, 1],
@@ -26,11 +31,7 @@ if __name__ == '__main__':
     print('Linear transformation given by A:')
     print(A)
     print('A.shape: ', A.shape)
-    print('det(A): ', np.linalg.det(A))
-
-    A_w, A_v = np.linalg.eig(A)
-    print('eigenvalues: ', A_w)
-    print('eigenvectors:', A_v)
+    print(analysis.describe(A))
 
     # input vectors
     i = np.array([1, 0])
@@ -46,7 +47,7 @@ if __name__ == '__main__':
     print('A x:\n', out_vectors[:-1])
 
     # Map grid coordinates to colors
-    colors = list(map(colorizer, xygrid[0], xygrid[1]))
+    colors = colorizer(xygrid[0], xygrid[1])
     print('2D grid points: ', len(colors))
 
     # plot original x-y grid points
@@ -55,11 +56,18 @@ if __name__ == '__main__':
     # plot transformed grid (uvgrid))
     static_plot(uvgrid, out_vectors, colors)
 
-    # generate intermediates transforms
-    transform = stepwise_transform(A, in_vectors, xygrid)
-
-    # generate intermediate plots
-    intermediate_plots(transform[0], transform[1], colors, outdir="2D_tmp")
+    # generate intermediates transforms lazily, one window of frames at a time
+    nsteps = 50
+    frames = iter_transform(A, in_vectors, xygrid, nsteps=nsteps,
+                            dtype=xygrid.dtype)
 
-    # generate animation with ImageMagick
-    os.system('convert -delay 10 2D_tmp/*.png 2D_animations/2D_animation.gif')
+    # generate intermediate plots and encode them straight into the animation,
+    # only the changed part of each frame, with one palette for all of them;
+    # frames are generated, drawn and encoded concurrently
+    with AnimationWriter('2D_animations/2D_animation.gif', delay=10,
+                         palette=global_palette(colors)) as writer:
+        intermediate_plots(frames, None, colors, writer=writer,
+                           cache=FrameCache(),
+                           nframes=nsteps + 1,
+                           maxval=transform_max(A, xygrid),
+                           pipelined=True)
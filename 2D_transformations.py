@@ -12,3 +12,7 @@ A = np.array([[3, 0],
 # shear
 A = np.array([[1, 2],
               [0, 1]])
+
+# rotation by 90 degrees
+A = np.array([[0, -1],
+              [1, 0]])
@@ -5,46 +5,17 @@
 # Based on Raibatak Das / created: Nov 2016 / modified: Dec 2016
 
 import numpy as np
-import matplotlib.pyplot as plt
-import os
 
+import plotting
+import visualization
+from visualization import (colorizer, intermediate_plots,  # noqa: F401
+                           stepwise_transform)
 
-def colorizer(x, y):
-    """
-    Map x-y coordinates to a rgb color
-    :param x: x coordinate
-    :param y: y coordinate
-    :return: (r, g, b)
-    """
-    r = min(1, 1 - y / 4)
-    g = 1 / 4 + x / 16
-    b = min(1, 1 + y / 4)
-    return r, g, b
-
+# size of the grid points, in points ** 2 as in plt.scatter
+MARKER_SIZE = 32
 
-def stepwise_transform(A, vector, grid, nsteps=50):
-    """
-    Generate a series of intermediate transform for the matrix multiplication
-    :param A: 2-by-2 matrix
-    :param points: 2-by-n array of coordinates in x-y space
-    :param nsteps: number of intermediate steps
-    :return: (nsteps + 1)-by-2-by-n array
-    """
-    # create empty array of the right size
-    transgrid = np.zeros((nsteps + 1,) + np.shape(grid))
-    transvector = np.zeros((nsteps + 1,) + np.shape(vector))
-
-    # compute intermediate transforms
-    for j in range(nsteps + 1):
-        Iden = np.identity(2)
-        fact = j / nsteps
-        intermediate = Iden + fact * (A - Iden)
-
-        # apply intermediate matrix transformation
-        transgrid[j] = np.matmul(intermediate, grid)
-        transvector[j] = np.matmul(intermediate, vector)
-
-    return transgrid, transvector
+# options of the savefig of png frames
+SAVEFIG_OPTIONS = {'bbox_inches': 'tight'}
 
 
 def static_plot(array, vector, colors):
@@ -54,12 +25,13 @@ def static_plot(array, vector, colors):
     :param vector:
     :param colors:
     """
-    origin = [[0, 0], [0, 0], [0, 0]]
+    origin = [[0, 0]] * vector.shape[1]
     X, Y = zip(*origin)
 
     U, V = zip(*vector.T)
-    color = ['red', 'green', 'yellow']
+    color = visualization.vector_colors(2, vector.shape[1])
 
+    plt = plotting.pyplot()
     with plt.xkcd():
         plt.figure(figsize=(4, 4), facecolor="w")
         ax = plt.gca()
@@ -70,50 +42,52 @@ def static_plot(array, vector, colors):
         plt.show()
 
 
-def intermediate_plots(transarray, transvector, colors, outdir="png-frames",
-                       figuresize=(4, 4), figuredpi=150):
+def style():
     """
-    Generate a series of png images showing a linear transformation stepwise
-    :param transarray: array to plot
-    :param color: color
-    :param outdir: directory name
-    :param figuresize: size of the figure
-    :param figuredpi: resolution of the figure
+    Style of the frames, xkcd
+    It applies as soon as it is called; used as a context, it is restored
+    on exit.
+    :return: context manager
     """
-    nsteps = transarray.shape[0]
-    ndigits = len(str(nsteps))  # to determine filename padding
-    maxval = np.abs(transarray.max())  # to set axis limits
-
-    # create directory if necessary
-    if not os.path.exists(outdir):
-        os.makedirs(outdir)
+    return plotting.pyplot().xkcd()
 
-    origin = [[0, 0], [0, 0], [0, 0]]
-    X, Y = zip(*origin)
-
-    color = ['red', 'green', 'yellow']
 
-    # create figure
-    with plt.xkcd():
-        plt.ioff()
-
-        plt.figure(figsize=figuresize, facecolor="w")
-        ax = plt.gca()
-        for j in range(nsteps):  # plot individual frames
-            U, V = zip(*transvector[j].T)
+def setup_axes(fig, maxval):
+    """
+    Add the axes of the frames to a new figure
+    :param fig: matplotlib figure
+    :param maxval: largest coordinate, to set axis limits
+    :return: the axes
+    """
+    ax = fig.gca()
+    ax.set_xlim(1.1 * np.array([-maxval, maxval]))
+    ax.set_ylim(1.1 * np.array([-maxval, maxval]))
+    ax.set_autoscale_on(False)
+    ax.set_facecolor('black')
+    ax.grid(False)
+    return ax
 
-            plt.cla()
-            ax.scatter(transarray[j, 0], transarray[j, 1],
-                       s=32, c=colors, edgecolor="none")
-            ax.quiver(X, Y, U, V, angles='xy', scale_units='xy', color=color, scale=1)
-            plt.xlim(1.1 * np.array([-maxval, maxval]))
-            plt.ylim(1.1 * np.array([-maxval, maxval]))
-            ax.set_facecolor('black')
-            plt.grid(False)
-            plt.draw()
 
-            # save as png
-            outfile = os.path.join(outdir, "frame-" + str(j + 1).
-                                   zfill(ndigits) + ".png")
-            plt.savefig(outfile, dpi=figuredpi, bbox_inches='tight')
-        plt.ion()
+def update_artists(ax, artists, grid, vector, colors):
+    """
+    Move the artists to a frame
+    The scatter and the quiver are created with the first frame, later
+    frames only update their data.
+    :param ax: axes returned by setup_axes
+    :param artists: dict holding the artists, empty before the first frame
+    :param grid: 2-by-n array of coordinates
+    :param vector: 2-by-m array of vectors
+    :param colors: colors of the grid points
+    """
+    if 'scatter' not in artists:
+        origin = np.zeros(vector.shape[1])
+        color = visualization.vector_colors(2, vector.shape[1])
+
+        artists['scatter'] = ax.scatter(grid[0], grid[1], s=MARKER_SIZE,
+                                        c=colors, edgecolor="none")
+        artists['quiver'] = ax.quiver(origin, origin, vector[0], vector[1],
+                                      angles='xy', scale_units='xy',
+                                      color=color, scale=1)
+    else:
+        artists['scatter'].set_offsets(grid.T)
+        artists['quiver'].set_UVC(vector[0], vector[1])
@@ -5,25 +5,28 @@
 # Based on Raibatak Das / created: Nov 2016 / modified: Dec 2016
 
 import numpy as np
-import matplotlib.pyplot as plt
 import os
 import math
 
-colorizer = __import__('3D_visualization_v1').colorizer
-stepwise_transform = __import__('3D_visualization_v1').stepwise_transform
-static_plot = __import__('3D_visualization_v1').static_plot
-intermediate_plots = __import__('3D_visualization_v1').intermediate_plots
+import analysis
+from animation_encoder import AnimationWriter, global_palette
+from frame_cache import FrameCache
+from grids import rectilinear_grid
+from scheduling import adaptive_facts
+from transform_engine import iter_transform, transform_max
+
+colorizer = __import__('3D_visualization_v01').colorizer
+stepwise_transform = __import__('3D_visualization_v01').stepwise_transform
+static_plot = __import__('3D_visualization_v01').static_plot
+intermediate_plots = __import__('3D_visualization_v01').intermediate_plots
 
 if __name__ == '__main__':
     # grid of points in x-y space
     xvals = np.linspace(-4, 4, 9)
     yvals = np.linspace(-4, 4, 9)
     zvals = np.linspace(-4, 4, 9)
-    xyzgrid = \
-        np.column_stack([[x, y, z]
-                         for x in xvals
-                         for y in yvals
-                         for z in zvals])
+    # float32 is far more precise than the pixels of the frames
+    xyzgrid = rectilinear_grid(xvals, yvals, zvals, dtype=np.float32)
 
     degrees = 90
     rotation = math.pi * degrees / 180
@@ -38,19 +41,14 @@ if __name__ == '__main__':
     print('Linear transformation given by A:')
     print(A)
     print('A.shape: ', A.shape)
-    print('det(A): ', np.linalg.det(A))
-
-    A_w, A_v = np.linalg.eig(A)
-    print('eigenvalues: ', A_w)
-    print('eigenvectors:', A_v)
+    print(analysis.describe(A))
 
-    print('-->', 3 * A_v[:, 0])
-
-    # input vectors
+    # input vectors; x is a real eigenvector (the axis of a rotation), or a
+    # direction of the rotation plane when there is none
     i = np.array([1, 0, 0])
     j = np.array([0, 1, 0])
     k = np.array([0, 0, 1])
-    x = 3 * (A_v[:, 0])
+    x = analysis.overlay_vector(A)
     in_vectors = np.column_stack((i, j, k, x))
 
     print('x:\n', in_vectors[:, -1])
@@ -60,7 +58,7 @@ if __name__ == '__main__':
     out_vectors = np.matmul(A, in_vectors)
 
     # Map grid coordinates to colors
-    colors = list(map(colorizer, xyzgrid[0], xyzgrid[1], xyzgrid[2]))
+    colors = colorizer(xyzgrid[0], xyzgrid[1], xyzgrid[2])
     print('3D grid points: ', len(colors))
 
     # plot original x-y grid points
@@ -69,15 +67,28 @@ if __name__ == '__main__':
     # plot transformed grid (uvgrid))
     static_plot(uvwgrid, out_vectors, colors)
 
-    # generate intermediates transforms
-    transform = stepwise_transform(A, in_vectors, xyzgrid)
-
-    # generate intermediate plots
-    intermediate_plots(transform[0], transform[1], colors, outdir="3D_tmp")
+    # generate intermediates transforms lazily, one window of frames at a time
+    # a rotation is best followed along the matrix exponential path; the
+    # linear path shrinks the grid through a singular matrix halfway
+    # frames are placed so that no point moves more than a few pixels of the
+    # 600 pixel frames between two of them
+    mode = "expm"
+    maxval = transform_max(A, xyzgrid, mode=mode)
+    facts = adaptive_facts(A, xyzgrid, in_vectors, maxval=maxval, mode=mode)
+    frames = iter_transform(A, in_vectors, xyzgrid, mode=mode,
+                            dtype=xyzgrid.dtype, facts=facts)
+    print('frames: ', len(facts))
 
-    # generate animation with ImageMagick
     # create directory if necessary
     if not os.path.exists('3D_animations'):
         os.makedirs('3D_animations')
 
-    os.system('convert -delay 10 3D_tmp/*.png 3D_animations/3D_animation.gif')
+    # generate intermediate plots and encode them straight into the animation,
+    # only the changed part of each frame, with one palette for all of them;
+    # frames are generated, drawn and encoded concurrently
+    with AnimationWriter('3D_animations/3D_animation.gif', delay=10,
+                         palette=global_palette(colors)) as writer:
+        intermediate_plots(frames, None, colors, writer=writer,
+                           cache=FrameCache(),
+                           nframes=len(facts), maxval=maxval,
+                           pipelined=True)
@@ -4,139 +4,103 @@
 # Created by: Santiago Vélez / Jul 2020
 # Based on Raibatak Das / created: Nov 2016 / modified: Dec 2016
 
+import contextlib
+
 import numpy as np
-import matplotlib.pyplot as plt
-import os
-from mpl_toolkits.mplot3d import Axes3D
 
+import plotting
+import visualization
+from visualization import (colorizer, intermediate_plots,  # noqa: F401
+                           stepwise_transform)
 
-def colorizer(x, y, z):
-    """
-    Map x-y-z coordinates to a rgb color
-    :param x: x coordinate
-    :param y: y coordinate
-    :return: (r, g, b)
-    """
-    r = min(1, 1 + x / 4)
-    g = min(0.25, 1 - y / 18)
-    b = min(1, 1 - z / 4)
+# size of the grid points, in points ** 2 as in plt.scatter
+MARKER_SIZE = 4
 
-    return r, g, b
+# options of the savefig of png frames
+SAVEFIG_OPTIONS = {}
 
 
-def stepwise_transform(A, vectors, grid, nsteps=50):
+def _quiver(ax, vector):
     """
-    Generate a series of intermediate transform for the matrix multiplication
-    :param A: 2-by-2 matrix
-    :param points: 2-by-n array of coordinates in x-y space
-    :param nsteps: number of intermediate steps
-    :return: (nsteps + 1)-by-2-by-n array
+    Draw a 3-by-m array of vectors as arrows from the origin
+    A 3D quiver draws every arrow as three lines, all the shafts first and
+    then the two strokes of each head, which are colored in that order.
     """
-    # create empty array of the right size
-    transgrid = np.zeros((nsteps + 1,) + np.shape(grid))
-    transvector = np.zeros((nsteps + 1,) + np.shape(vectors))
-
-    # compute intermediate transforms
-    for j in range(nsteps + 1):
-        Iden = np.identity(3)
-        fact = j / nsteps
-        intermediate = Iden + fact * (A - Iden)
-
-        # apply intermediate matrix transformation
-        transgrid[j] = np.matmul(intermediate, grid)
-        transvector[j] = np.matmul(intermediate, vectors)
-
-    return transgrid, transvector
+    color = visualization.vector_colors(3, vector.shape[1])
+    origin = np.zeros(vector.shape[1])
+    return ax.quiver(origin, origin, origin, vector[0], vector[1], vector[2],
+                     color=color + [c for c in color for _ in range(2)])
 
 
 def static_plot(array, vectors, colors):
-    origin = [[0, 0, 0], [0, 0, 0], [0, 0, 0], [0, 0, 0]]
-    X, Y, Z = zip(*origin)
-
-    U, V, W = zip(*vectors.T)
-    color = ['red', 'green', 'blue', 'yellow',
-             'red', 'red',
-             'green', 'green',
-             'blue', 'blue',
-             'yellow', 'yellow']
-
+    plt = plotting.pyplot(mplot3d=True)
     fig = plt.figure(figsize=(4, 4), facecolor="w")
     ax = fig.add_subplot(111, projection='3d')
     ax.scatter(array[0], array[1], array[2], s=2, c=colors)
-    ax.quiver(X, Y, Z, U, V, W, color=color)
+    _quiver(ax, vectors)
     fig.set_facecolor('black')
     ax.set_facecolor('black')
-    ax.w_xaxis.set_pane_color((0.0, 0.0, 0.0, 0.0))
-    ax.w_yaxis.set_pane_color((0.0, 0.0, 0.0, 0.0))
-    ax.w_zaxis.set_pane_color((0.0, 0.0, 0.0, 0.0))
+    ax.xaxis.set_pane_color((0.0, 0.0, 0.0, 0.0))
+    ax.yaxis.set_pane_color((0.0, 0.0, 0.0, 0.0))
+    ax.zaxis.set_pane_color((0.0, 0.0, 0.0, 0.0))
     plt.show()
 
 
-def intermediate_plots(transarray, transvector, colors, outdir="png-frames", figuredpi=150):
+def style():
+    """
+    Style of the frames, the default one
+    :return: context manager
+    """
+    return contextlib.nullcontext()
+
+
+def setup_axes(fig, maxval):
+    """
+    Add the axes of the frames to a new figure
+    :param fig: matplotlib figure
+    :param maxval: largest coordinate, to set axis limits
+    :return: the 3D axes
+    """
+    import mpl_toolkits.mplot3d  # noqa: F401 registers projection='3d'
+    ax = fig.add_subplot(111, projection='3d')
+
+    fig.set_facecolor('black')
+    ax.set_facecolor('black')
+    ax.xaxis.set_pane_color((0.0, 0.0, 0.0, 0.0))
+    ax.yaxis.set_pane_color((0.0, 0.0, 0.0, 0.0))
+    ax.zaxis.set_pane_color((0.0, 0.0, 0.0, 0.0))
+
+    ax.set_xlim(1.1 * np.array([-maxval, maxval]))
+    ax.set_ylim(1.1 * np.array([-maxval, maxval]))
+    ax.set_zlim(1.1 * np.array([-maxval, maxval]))
+    ax.set_autoscale_on(False)
+    ax.set_xticks(np.arange(-maxval, maxval, step=2))
+    ax.set_yticks(np.arange(-maxval, maxval, step=2))
+    ax.set_zticks(np.arange(-maxval, maxval, step=2))
+
+    ax.tick_params(axis='both', which='major', labelsize=6)
+    ax.tick_params(axis='both', which='minor', labelsize=6)
+
+    ax.grid(True)
+    return ax
+
+
+def update_artists(ax, artists, grid, vector, colors):
     """
-    Generate a series of png images showing a linear transformation stepwise
-    :param transarray: array to plot
-    :param color: color
-    :param outdir: directory name
-    :param figuresize: size of the figure
-    :param figuredpi: resolution of the figure
+    Move the artists to a frame
+    The scatter is created with the first frame, later frames only move its
+    points. The few quiver arrows are redrawn, as 3D quivers cannot be
+    updated in place.
+    :param ax: axes returned by setup_axes
+    :param artists: dict holding the artists, empty before the first frame
+    :param grid: 3-by-n array of coordinates
+    :param vector: 3-by-m array of vectors
+    :param colors: colors of the grid points
     """
-    nsteps = transarray.shape[0]
-    ndigits = len(str(nsteps))  # to determine filename padding
-    maxval = np.abs(transarray.max())  # to set axis limits
-
-    origin = [[0, 0, 0], [0, 0, 0], [0, 0, 0], [0, 0, 0]]
-    X, Y, Z = zip(*origin)
-
-    color = ['red', 'green', 'blue', 'yellow',
-             'red', 'red',
-             'green', 'green',
-             'blue', 'blue',
-             'yellow', 'yellow']
-
-    # create directory if necessary
-    if not os.path.exists(outdir):
-        os.makedirs(outdir)
-
-    # create figure
-    plt.ioff()
-
-    for j in range(nsteps):  # plot individual frames
-        U, V, W = zip(*transvector[j].T)
-        fig = plt.figure(figsize=(4, 4), facecolor="w")
-
-        ax = fig.add_subplot(111, projection='3d')
-        plt.cla()
-        ax.scatter(transarray[j, 0],
-                   transarray[j, 1],
-                   transarray[j, 2],
-                   s=4, c=colors)
-        ax.quiver(X, Y, Z, U, V, W, color=color)
-
-        fig.set_facecolor('black')
-        ax.set_facecolor('black')
-        ax.w_xaxis.set_pane_color((0.0, 0.0, 0.0, 0.0))
-        ax.w_yaxis.set_pane_color((0.0, 0.0, 0.0, 0.0))
-        ax.w_zaxis.set_pane_color((0.0, 0.0, 0.0, 0.0))
-
-        ax.set_xlim(1.1 * np.array([-maxval, maxval]))
-        ax.set_ylim(1.1 * np.array([-maxval, maxval]))
-        ax.set_zlim(1.1 * np.array([-maxval, maxval]))
-        ax.set_xticks(np.arange(-maxval, maxval, step=2))
-        ax.set_yticks(np.arange(-maxval, maxval, step=2))
-        ax.set_zticks(np.arange(-maxval, maxval, step=2))
-
-        ax.tick_params(axis='both', which='major', labelsize=6)
-        ax.tick_params(axis='both', which='minor', labelsize=6)
-
-        plt.grid(True)
-        plt.draw()
-
-        # save as png
-        outfile = os.path.join(outdir, "frame-" + str(j + 1).
-                               zfill(ndigits) + ".png")
-        fig.savefig(outfile, dpi=figuredpi)
-
-        plt.cla()
-        plt.close(fig)
-    plt.ion()
+    if 'scatter' not in artists:
+        artists['scatter'] = ax.scatter(grid[0], grid[1], grid[2],
+                                        s=MARKER_SIZE, c=colors)
+    else:
+        artists['scatter']._offsets3d = (grid[0], grid[1], grid[2])
+        artists['quiver'].remove()
+    artists['quiver'] = _quiver(ax, vector)
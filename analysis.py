@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# Spectral analysis of the animated matrices
+#
+# The main scripts, the overlay vectors, the interpolation paths and the
+# batch runner all need the eigendecomposition, the determinant or the
+# singular values of the same matrices. analyze() computes them once per
+# matrix and caches them, as interpolation.py does for its factorizations,
+# so a batch over many jobs never factors a matrix twice.
+#
+# Real matrices may have complex eigenpairs (rotations): their real
+# invariant subspace is the plane spanned by the real and imaginary parts
+# of the eigenvector, in which the matrix rotates and scales.
+
+import collections
+import functools
+
+import numpy as np
+
+# eigenvalues are taken as real below this imaginary part
+REAL_TOL = 1e-9
+
+Spectrum = collections.namedtuple(
+    "Spectrum", ["det", "eigenvalues", "eigenvectors", "inverse",
+                 "svd", "subspaces"])
+Spectrum.__doc__ = """
+Cached spectral data of a d-by-d matrix
+det: determinant
+eigenvalues, eigenvectors: as returned by np.linalg.eig
+inverse: inverse of the eigenvector matrix, None when it is singular
+svd: (W, s, Vh) as returned by np.linalg.svd
+subspaces: real invariant subspaces, list of (eigenvalue, basis) with a
+           d-by-1 basis for a real eigenvalue and an orthonormal d-by-2
+           basis of the rotation plane of a complex pair (eigenvalue with
+           a positive imaginary part)
+"""
+
+
+def _readonly(*arrays):
+    """
+    Protect cached arrays from being modified by their users
+    """
+    for array in arrays:
+        array.flags.writeable = False
+
+
+def _invariant_subspaces(w, V):
+    """
+    Real invariant subspaces of a real matrix from its eigendecomposition
+    :param w: eigenvalues
+    :param V: eigenvectors, as columns
+    :return: list of (eigenvalue, basis), see Spectrum
+    """
+    subspaces = []
+    for value, vector in zip(w, V.T):
+        if abs(value.imag) <= REAL_TOL:
+            vector = vector.real / np.linalg.norm(vector.real)
+            # sign fixed so that the largest component is positive
+            vector = vector * np.sign(vector[np.argmax(np.abs(vector))])
+            subspaces.append((value.real, vector[:, None]))
+        elif value.imag > 0:
+            # the conjugate eigenpair spans the same plane
+            plane, _ = np.linalg.qr(np.column_stack((vector.real,
+                                                     vector.imag)))
+            subspaces.append((value, plane))
+    return subspaces
+
+
+@functools.lru_cache(maxsize=256)
+def _analyze(data, shape):
+    """
+    Cached spectral data of a matrix
+    :param data: bytes of the float64 matrix
+    :param shape: shape of the matrix
+    :return: Spectrum
+    """
+    A = np.frombuffer(data).reshape(shape)
+
+    w, V = np.linalg.eig(A)
+    try:
+        inverse = np.linalg.inv(V)
+    except np.linalg.LinAlgError:
+        inverse = None
+    W, s, Vh = np.linalg.svd(A)
+    subspaces = _invariant_subspaces(w, V)
+
+    _readonly(w, V, W, s, Vh, *(basis for _, basis in subspaces))
+    if inverse is not None:
+        _readonly(inverse)
+    return Spectrum(np.linalg.det(A), w, V, inverse, (W, s, Vh), subspaces)
+
+
+def analyze(A):
+    """
+    Spectral data of a matrix, computed once and cached
+    :param A: d-by-d matrix
+    :return: Spectrum, whose arrays are read-only
+    """
+    A = np.ascontiguousarray(A, dtype=np.float64)
+    return _analyze(A.tobytes(), A.shape)
+
+
+def overlay_vector(A, scale=3):
+    """
+    Vector drawn over the animation to show how A acts
+    It is the first real eigenvector, which A only stretches (the axis of a
+    3D rotation); a matrix without real eigenvalues (a 2D rotation) shows
+    the first direction of its rotation plane instead.
+    :param A: d-by-d matrix
+    :param scale: length of the vector
+    :return: real vector of length d
+    """
+    subspaces = analyze(A).subspaces
+    for value, basis in subspaces:
+        if basis.shape[1] == 1:
+            return scale * basis[:, 0]
+    return scale * subspaces[0][1][:, 0]
+
+
+def default_vectors(A):
+    """
+    Basis vectors plus the overlay vector, the arrows drawn by default
+    :param A: d-by-d matrix
+    :return: d-by-(d + 1) array
+    """
+    return np.column_stack((np.identity(len(A)), overlay_vector(A)))
+
+
+def describe(A):
+    """
+    Human readable summary of the spectral data, as printed by the scripts
+    :param A: d-by-d matrix
+    :return: str
+    """
+    spectrum = analyze(A)
+    lines = ['det(A): {}'.format(spectrum.det),
+             'eigenvalues: {}'.format(spectrum.eigenvalues),
+             'singular values: {}'.format(spectrum.svd[1])]
+    for value, basis in spectrum.subspaces:
+        if basis.shape[1] == 1:
+            lines.append('invariant line ({:.4g}): {}'
+                         .format(value, basis[:, 0]))
+        else:
+            lines.append('rotation plane ({:.4g} rad, x{:.4g}): {}, {}'
+                         .format(np.angle(value), abs(value),
+                                 basis[:, 0], basis[:, 1]))
+    return '\n'.join(lines)
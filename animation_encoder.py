@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# In-process encoding of animation frames to GIF, APNG or MP4
+#
+# Frames are the raw RGBA buffers of a matplotlib canvas
+# (fig.canvas.buffer_rgba()), so no temporary png files and no ImageMagick
+# round trip are needed.
+#
+# With a global palette (see global_palette), GIF frames are mapped to that
+# single palette and only the rectangle that changed since the previous
+# frame is encoded: the static background, axes and panes are stored once.
+
+import os
+import shutil
+import struct
+import subprocess
+
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+import rasterizer
+
+
+def global_palette(colors, extra=('red', 'green', 'blue', 'yellow'),
+                   grays=32, size=256):
+    """
+    Palette shared by every frame of a GIF, built once from the point colors
+    It holds a ramp of grays (background, axes, ticks and their
+    antialiasing), the extra colors and the colors of the points with their
+    darker shades (edges blended into a black background), reduced by
+    median cut to fit. Large point sets are sampled evenly first.
+    :param colors: n-by-3 (or n-by-4) colors in [0, 1], as returned by the
+                   colorizer
+    :param extra: colors of the arrows, names or (r, g, b) values in [0, 1]
+    :param grays: number of gray levels
+    :param size: number of palette entries, at most 256
+    :return: size-by-3 uint8 array
+    """
+    ramp = np.linspace(0, 255, grays).round().astype(np.uint8)
+    fixed = np.concatenate((np.repeat(ramp[:, None], 3, axis=1),
+                            rasterizer.to_rgb(list(extra))))
+    fixed = np.unique(fixed, axis=0)
+
+    # a regular sample of a few tens of thousands of colors is enough for
+    # the median cut, and keeps memory-mapped colors from being read whole
+    points = rasterizer.to_rgb(colors[::max(1, len(colors) >> 16)])
+    points = np.unique(np.concatenate((points, points // 2)), axis=0)
+    free = size - len(fixed)
+    if len(points) > free:
+        image = Image.fromarray(points[None])
+        reduced = image.quantize(free, method=Image.Quantize.MEDIANCUT)
+        points = np.array(reduced.getpalette()[:3 * free],
+                          dtype=np.uint8).reshape(-1, 3)
+
+    palette = np.zeros((size, 3), dtype=np.uint8)
+    palette[:len(fixed)] = fixed
+    palette[len(fixed):len(fixed) + len(points)] = points
+    return palette
+
+
+class AnimationWriter:
+    """
+    Collect RGBA frames and write them as an animation
+    The format follows the file extension: .gif, .png/.apng or .mp4.
+    GIF frames are palette quantized as they arrive, APNG frames are kept
+    losslessly and MP4 frames are piped to ffmpeg. GIFs with a global
+    palette are written as they arrive, one changed rectangle per frame.
+    """
+
+    def __init__(self, filename, delay=10, colors=256,
+                 method=Image.Quantize.MEDIANCUT, palette=None):
+        """
+        :param filename: output file name
+        :param delay: delay between frames in hundredths of a second,
+                      as in `convert -delay`
+        :param colors: size of the GIF palette
+        :param method: PIL quantization method of the GIF palette
+        :param palette: global GIF palette (see global_palette); frames are
+                        then delta encoded instead of quantized one by one
+        """
+        self.filename = filename
+        self.delay = delay
+        self.colors = colors
+        self.method = method
+        self.frames = []
+        self.size = None
+        self.ffmpeg = None
+
+        self.palette = None
+        self.file = None
+        self.previous = None
+        self.pending = None
+        if palette is not None:
+            self.palette = Image.new('P', (1, 1))
+            self.palette.putpalette(np.asarray(palette, dtype=np.uint8)
+                                    .ravel().tolist())
+
+        self.format = os.path.splitext(filename)[1].lower().lstrip('.')
+        if self.format == 'apng':
+            self.format = 'png'
+        if self.format not in ('gif', 'png', 'mp4'):
+            raise ValueError('unsupported animation format: ' + filename)
+
+        if self.format == 'mp4' and shutil.which('ffmpeg') is None:
+            raise RuntimeError('ffmpeg is required to write ' + filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, rgba):
+        """
+        Add a frame to the animation
+        :param rgba: height-by-width-by-4 uint8 array
+        """
+        rgba = np.asarray(rgba)
+        size = rgba.shape[1], rgba.shape[0]
+        if self.size is None:
+            self.size = size
+        elif size != self.size:
+            raise ValueError('frame size {} differs from {}'
+                             .format(size, self.size))
+
+        if self.format == 'gif' and self.palette is not None:
+            self._append_delta(rgba)
+        elif self.format == 'gif':
+            image = Image.fromarray(rgba[..., :3])
+            self.frames.append(image.quantize(self.colors, method=self.method))
+        elif self.format == 'png':
+            self.frames.append(Image.fromarray(rgba.copy()))
+        else:
+            if self.ffmpeg is None:
+                self.ffmpeg = self._open_ffmpeg()
+            self.ffmpeg.stdin.write(np.ascontiguousarray(rgba).tobytes())
+
+    def _append_delta(self, rgba):
+        """
+        Map a frame to the global palette and queue the rectangle that
+        changed since the previous frame
+        """
+        image = Image.fromarray(np.ascontiguousarray(rgba[..., :3]))
+        index = np.asarray(image.quantize(palette=self.palette,
+                                          dither=Image.Dither.NONE))
+
+        if self.previous is None:
+            self._write_header()
+            top, left, bottom, right = 0, 0, index.shape[0], index.shape[1]
+        else:
+            changed = index != self.previous
+            rows = np.flatnonzero(changed.any(axis=1))
+            if not len(rows):
+                # identical frame: show the previous one longer
+                self.pending[2] += self.delay
+                return
+            cols = np.flatnonzero(changed.any(axis=0))
+            top, left = rows[0], cols[0]
+            bottom, right = rows[-1] + 1, cols[-1] + 1
+
+        # the delay of a frame is known once the next one differs from it
+        self._write_pending()
+        self.pending = [index[top:bottom, left:right], (left, top),
+                        self.delay]
+        self.previous = index
+
+    def _write_header(self):
+        """
+        Open the GIF and write the screen descriptor, the global palette and
+        the looping extension
+        """
+        self.file = open(self.filename, 'wb')
+        # global color table of 256 entries, 8 bits per channel
+        self.file.write(b'GIF89a' + struct.pack('<HHBBB', self.size[0],
+                                                self.size[1], 0xF7, 0, 0))
+        self.file.write(bytes(self.palette.getpalette()[:768]))
+        self.file.write(b'!\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+
+    def _write_pending(self):
+        """
+        Encode the queued rectangle over the previous frames
+        """
+        if self.pending is None:
+            return
+        index, offset, delay = self.pending
+        height, width = index.shape
+        image = Image.frombytes('P', (width, height),
+                                np.ascontiguousarray(index).tobytes())
+        # disposal 1: keep the previous frame under the rectangle
+        for data in GifImagePlugin.getdata(image, offset,
+                                           duration=10 * delay, disposal=1):
+            self.file.write(data)
+        self.pending = None
+
+    def _open_ffmpeg(self):
+        """
+        Start an ffmpeg process reading raw RGBA frames from its stdin
+        """
+        command = ['ffmpeg', '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                   '-s', '{}x{}'.format(*self.size),
+                   '-r', str(100 / self.delay), '-i', '-',
+                   # yuv420p needs even dimensions
+                   '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                   '-pix_fmt', 'yuv420p', '-vcodec', 'libx264',
+                   self.filename]
+        return subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def close(self):
+        """
+        Write the animation to disk
+        """
+        if self.ffmpeg is not None:
+            self.ffmpeg.stdin.close()
+            if self.ffmpeg.wait() != 0:
+                raise RuntimeError('ffmpeg failed to write ' + self.filename)
+            self.ffmpeg = None
+        elif self.file is not None:
+            self._write_pending()
+            self.file.write(b';')
+            self.file.close()
+            self.file = None
+            self.previous = None
+        elif self.frames:
+            self.frames[0].save(self.filename, format=self.format.upper(),
+                                save_all=True,
+                                append_images=self.frames[1:],
+                                duration=self.delay * 10, loop=0)
+            self.frames = []
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# Render many linear transformation animations in one invocation
+#
+# Usage: python batch_render.py batch_jobs.json [--workers N]
+#                               [--profile trace.json]
+#
+# The spec file is JSON:
+# {
+#     "grid": {"low": -4, "high": 4, "num": 9},
+#     "defaults": {"nsteps": 50, "mode": "linear", "delay": 10, "dpi": 150,
+#                  "figuresize": [4, 4], "backend": "matplotlib",
+#                  "dtype": "float32"},
+#     "jobs": [
+#         {"matrix": [[1, 2], [0, 1]], "output": "batch_output/shear.gif"},
+#         {"matrix": [[0, -1, 0], [1, 0, 0], [0, 0, 1]], "mode": "expm",
+#          "output": "batch_output/rotation.gif"}
+#     ]
+# }
+#
+# Each job may override any default and give its own "vectors" (list of
+# vectors drawn as arrows). A job with a "chain" of matrices instead of a
+# "matrix" animates them one after another in a single animation; its "mode"
+# and "nsteps" may then be lists with one value per matrix. A single-matrix
+# job with a "budget" (in pixels) places its frames adaptively instead of
+# taking nsteps uniform steps (a chain job with a budget is rejected), and a
+# job with "dedupe": true skips the frames that would look identical to the
+# one before, see scheduling.py. Matrices of more than 3 dimensions are
+# projected to 3D for rendering (see visualization.py). The grid and its
+# colors are built once per dimension and shared by every job; a job with an
+# "input" file (point cloud, mesh or image, see loaders.py) animates its
+# points instead, read once into a memory-mapped point store that the workers
+# map; the points of a .npy input are its rows, or its columns with "layout":
+# "columns". Jobs are spread over a process pool.
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import analysis
+import loaders
+import plotting
+import profiling
+import visualization
+from animation_encoder import AnimationWriter, global_palette
+from grids import linspace_grid
+from scheduling import adaptive_facts, dedupe_frames, pixel_scale
+from transform_engine import (chain_max, chain_products, iter_chain,
+                              iter_transform, transform_max)
+
+DEFAULTS = {"nsteps": 50, "mode": "linear", "delay": 10, "dpi": 150,
+            "figuresize": [4, 4], "backend": "matplotlib",
+            "dtype": "float64", "dedupe": False, "layout": "rows"}
+
+# grids and colors shared by the jobs of this process, by dimension
+_shared = {}
+
+
+def load_jobs(specfile):
+    """
+    Read a spec file and fill every job with the defaults
+    :param specfile: path of the JSON spec
+    :return: (grid spec, list of job dicts)
+    """
+    with open(specfile) as f:
+        spec = json.load(f)
+
+    defaults = dict(DEFAULTS, **spec.get("defaults", {}))
+    jobs = []
+    try:
+        for number, job in enumerate(spec["jobs"]):
+            job = dict(defaults, **job)
+            # listed first, so that its point store is removed on errors
+            jobs.append(job)
+            job.setdefault("name", "job-{}".format(number + 1))
+            if "chain" in job:
+                if "budget" in job:
+                    raise ValueError("{}: a budget only applies to a single "
+                                     "matrix, not to a chain".format(
+                                         job["name"]))
+                job["chain"] = [np.array(A, dtype=np.float64)
+                                for A in job["chain"]]
+                job["matrix"] = chain_products(job["chain"])[-1]
+            job["matrix"] = np.array(job["matrix"], dtype=np.float64)
+            if "vectors" in job:
+                job["vectors"] = np.array(job["vectors"],
+                                          dtype=np.float64).T
+            else:
+                job["vectors"] = analysis.default_vectors(job["matrix"])
+            if "input" in job:
+                job["points"] = tempfile.mkdtemp(prefix="points-")
+                grid, _ = loaders.load(job["input"], job["points"],
+                                       dtype=job["dtype"],
+                                       layout=job["layout"])
+                if len(grid) != len(job["matrix"]):
+                    raise ValueError("{}: {}D points for a {}D matrix".format(
+                        job["name"], len(grid), len(job["matrix"])))
+    except BaseException:
+        remove_points(jobs)
+        raise
+
+    return spec.get("grid", {}), jobs
+
+
+def remove_points(jobs):
+    """
+    Delete the point stores of the jobs with an input file
+    :param jobs: job dicts returned by load_jobs
+    """
+    for job in jobs:
+        if "points" in job:
+            shutil.rmtree(job["points"], ignore_errors=True)
+
+
+def shared_state(gridspec, dims):
+    """
+    Build the grid and the colors of every dimension used by the jobs
+    :param gridspec: keyword arguments of grids.linspace_grid
+    :param dims: dimensions needed
+    :return: dict mapping a dimension to its (grid, colors)
+    """
+    state = {}
+    for dim in dims:
+        grid = linspace_grid(dim=dim, **gridspec)
+        state[dim] = grid, visualization.colorizer(*grid)
+    return state
+
+
+def _init_worker(state, profile=False):
+    """
+    Keep the shared grids and colors in the worker process
+    :param state: dict returned by shared_state
+    :param profile: record the stages of the jobs (see profiling.py)
+    """
+    _shared.update(state)
+    if profile:
+        profiling.enable()
+
+
+def render_job(job):
+    """
+    Render one job with the shared grid and colors of its dimension, or
+    with the points of its input file
+    :param job: job dict, see load_jobs
+    :return: (job name, output, elapsed seconds, profiling events)
+    """
+    start = time.time()
+    A = job["matrix"]
+    if "points" in job:
+        grid, colors = loaders.open_points(job["points"])
+    else:
+        grid, colors = _shared[len(A)]
+
+    outdir = os.path.dirname(job["output"])
+    if outdir and not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    dtype = np.dtype(job["dtype"])
+    # width of the frames in pixels, for the pixel budgets
+    figuresize = tuple(job["figuresize"])
+    size = int(figuresize[0] * job["dpi"])
+    if "chain" in job:
+        frames = iter_chain(job["chain"], job["vectors"], grid,
+                            nsteps=job["nsteps"], mode=job["mode"],
+                            dtype=dtype)
+        maxval = chain_max(job["chain"], grid, mode=job["mode"],
+                           nsteps=job["nsteps"])
+        # nsteps is one number, or one number per stage
+        nframes = int(np.sum(np.broadcast_to(job["nsteps"],
+                                             len(job["chain"])))) + 1
+    else:
+        maxval = transform_max(A, grid, mode=job["mode"],
+                               nsteps=job["nsteps"])
+        facts = None
+        if "budget" in job:
+            facts = adaptive_facts(A, grid, job["vectors"], maxval=maxval,
+                                   size=size, budget=job["budget"],
+                                   mode=job["mode"])
+        frames = iter_transform(A, job["vectors"], grid,
+                                nsteps=job["nsteps"], mode=job["mode"],
+                                dtype=dtype, facts=facts)
+        nframes = job["nsteps"] + 1 if facts is None else len(facts)
+
+    if job["dedupe"]:
+        # nframes stays an upper bound, it only pads the frame names
+        frames = dedupe_frames(frames, pixel_scale(maxval, size))
+
+    with AnimationWriter(job["output"], delay=job["delay"],
+                         palette=global_palette(colors)) as writer:
+        visualization.intermediate_plots(frames, None, colors,
+                                         figuresize=figuresize,
+                                         figuredpi=job["dpi"],
+                                         nframes=nframes, maxval=maxval,
+                                         writer=writer,
+                                         backend=job["backend"])
+
+    return job["name"], job["output"], time.time() - start, profiling.drain()
+
+
+def _report(results):
+    """
+    Print the results of the jobs as they complete
+    :param results: iterable of the results of render_job
+    :return: profiling events of all the jobs
+    """
+    events = []
+    for name, output, elapsed, jobevents in results:
+        print('{}: {} ({:.1f} s)'.format(name, output, elapsed))
+        events += jobevents
+    return events
+
+
+def run_batch(specfile, workers=None, profile=None):
+    """
+    Render every job of a spec file
+    :param specfile: path of the JSON spec
+    :param workers: number of processes, all cores by default
+    :param profile: file receiving a Chrome trace of the render stages,
+                    whose summary is printed; None to not profile
+    """
+    gridspec, jobs = load_jobs(specfile)
+    try:
+        dims = sorted({len(job["matrix"]) for job in jobs
+                       if "points" not in job})
+        initargs = (shared_state(gridspec, dims), profile is not None)
+
+        if workers == 1:
+            _init_worker(*initargs)
+            events = _report(map(render_job, jobs))
+        else:
+            with multiprocessing.Pool(workers, initializer=_init_worker,
+                                      initargs=initargs) as pool:
+                events = _report(pool.imap_unordered(render_job, jobs))
+    finally:
+        # also when a job fails, the pool is then terminated
+        remove_points(jobs)
+
+    if profile is not None:
+        print(profiling.summary(events))
+        profiling.write_trace(profile, events)
+
+
+if __name__ == '__main__':
+    plotting.use_headless()
+
+    parser = argparse.ArgumentParser(
+        description='Render many linear transformation animations')
+    parser.add_argument('specfile', help='JSON file listing the jobs')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes (default: all cores)')
+    parser.add_argument('--profile', metavar='TRACE', default=None,
+                        help='time the render stages and write a Chrome '
+                             'trace to TRACE')
+    args = parser.parse_args()
+
+    run_batch(args.specfile, args.workers, args.profile)
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# Benchmarks of the transform, colorize, render and encode stages
+#
+# Usage: python benchmark.py [--quick] [--dtype float32]
+#                             [--output bench_results.json]
+#
+# Every stage is timed separately for the 2D and 3D modules over a sweep of
+# grid sizes, numbers of steps and resolutions. Each record reports the
+# wall time, the throughput (points * frames / s and frames / s) and the
+# peak memory traced during the stage. The v00 loop implementations are
+# timed alongside as a baseline.
+#
+# With a reduced precision --dtype, the frames are also checked against the
+# float64 result: the largest point displacement must stay below half a
+# pixel of the rendered frames.
+#
+# Every dimension of --dims (including those above 3, which have no sweep)
+# is also checked end to end: a small transform is rendered from stacked
+# arrays, a stream and a frame store with both backends, with one vector
+# more than the dimension as the batch runner draws. Edge cases of the
+# interpolation paths are checked once (see check_paths).
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import plotting
+import rasterizer
+import visualization
+from animation_encoder import AnimationWriter
+from grids import linspace_grid
+from interpolation import interpolate
+from scheduling import adaptive_facts
+from transform_engine import batched_transform, iter_transform, transform_max
+
+# grid points per axis, nsteps and dpi swept by default and by --quick
+SWEEPS = {
+    "full": {2: [9, 100, 300, 1000], 3: [9, 50, 100, 200],
+             "nsteps": [50, 200], "dpi": [75, 150]},
+    "quick": {2: [9, 100], 3: [9, 20],
+              "nsteps": [50], "dpi": [75]},
+}
+
+# frames rendered per render benchmark, and stacks larger than this many
+# bytes are only benchmarked through the streaming iter_transform
+RENDER_FRAMES = 5
+MAX_STACK_BYTES = 2 << 30
+
+# each timing is the best of this many runs
+repeat = 3
+
+
+class NullWriter:
+    """
+    Writer discarding the frames, to time rendering alone
+    """
+
+    def append(self, rgba):
+        pass
+
+
+class CountingWriter:
+    """
+    Writer counting the frames it receives
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def append(self, rgba):
+        self.count += 1
+
+
+def _module(dim, version="v01"):
+    """
+    Visualization module of the given dimension and version
+    """
+    return __import__('{}D_visualization_{}'.format(dim, version))
+
+
+def _matrix(dim):
+    """
+    Fixed, well conditioned test matrix
+    """
+    return np.identity(dim) + np.triu(np.ones((dim, dim)), 1) / 2
+
+
+def measure(stage, function, dim, points, nframes, **params):
+    """
+    Time function (best of repeat runs) and trace its peak memory
+    The memory is traced during an extra first run, which also warms up
+    imports and caches.
+    :param stage: name of the stage
+    :param function: callable without arguments
+    :param dim: dimension of the grid
+    :param points: number of grid points
+    :param nframes: number of frames produced by the call
+    :param params: extra fields of the record
+    :return: record dict
+    """
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    record = dict(stage=stage, dim=dim, points=points, nframes=nframes,
+                  seconds=seconds,
+                  points_frames_per_s=points * nframes / seconds,
+                  frames_per_s=nframes / seconds,
+                  peak_mb=peak / 2 ** 20, **params)
+    print('{stage:>20} {dim}D {points:>9} pts {nframes:>4} frames '
+          '{seconds:9.4f} s {frames_per_s:10.1f} fps '
+          '{peak_mb:9.1f} MB'.format(**record))
+    return record
+
+
+def bench_transform(dim, grid, nsteps):
+    """
+    Batched, streamed and v00 loop transforms, in the dtype of the grid
+    """
+    A = _matrix(dim)
+    vector = np.identity(dim)
+    points = grid.shape[1]
+    dtype = grid.dtype
+    records = []
+
+    if (nsteps + 1) * grid.nbytes <= MAX_STACK_BYTES:
+        records.append(measure(
+            "transform",
+            lambda: batched_transform(A, vector, grid, nsteps, dtype=dtype),
+            dim, points, nsteps + 1, nsteps=nsteps, dtype=dtype.name))
+        records.append(measure(
+            "transform_v00",
+            lambda: _module(dim, "v00").stepwise_transform(A, grid, nsteps),
+            dim, points, nsteps + 1, nsteps=nsteps))
+
+    def stream():
+        for _ in iter_transform(A, vector, grid, nsteps, dtype=dtype):
+            pass
+    records.append(measure("transform_stream", stream, dim, points,
+                           nsteps + 1, nsteps=nsteps, dtype=dtype.name))
+    return records
+
+
+def bench_colorize(dim, grid):
+    """
+    Vectorized colorizer and the v00 scalar map
+    """
+    records = [measure("colorize", lambda: _module(dim).colorizer(*grid),
+                       dim, grid.shape[1], 1)]
+    if grid.shape[1] <= 10 ** 6:
+        colorizer = _module(dim, "v00").colorizer
+        records.append(measure("colorize_v00",
+                               lambda: list(map(colorizer, *grid)),
+                               dim, grid.shape[1], 1))
+    return records
+
+
+def bench_render(dim, grid, colors, dpi):
+    """
+    Per frame cost of the matplotlib and raster backends
+    """
+    A = _matrix(dim)
+    vector = np.identity(dim + 1)[:dim]
+    maxval = transform_max(A, grid)
+    nsteps = RENDER_FRAMES - 1
+    records = []
+
+    for backend in ("matplotlib", "raster"):
+        def render():
+            frames = iter_transform(A, vector, grid, nsteps, dtype=grid.dtype)
+            _module(dim).intermediate_plots(
+                frames, None, colors, figuredpi=dpi, nframes=nsteps + 1,
+                maxval=maxval, writer=NullWriter(), backend=backend)
+        records.append(measure("render_" + backend, render, dim,
+                               grid.shape[1], RENDER_FRAMES, dpi=dpi,
+                               dtype=grid.dtype.name))
+    return records
+
+
+def bench_encode(dim, dpi, nframes=20):
+    """
+    GIF assembly of synthetic frames of the size rendered at dpi
+    """
+    size = 4 * dpi
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, (nframes, size, size, 4), dtype=np.uint8)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "bench.gif")
+
+        def encode():
+            with AnimationWriter(output) as writer:
+                for rgba in frames:
+                    writer.append(rgba)
+        return [measure("encode_gif", encode, dim, size * size, nframes,
+                        dpi=dpi)]
+
+
+def check_precision(dim, dtype, num=9, nsteps=50, dpi=150, tolerance=0.5):
+    """
+    Compare the frames computed in dtype with the float64 reference
+    The largest displacement of a grid point is measured in pixels of frames
+    rendered at dpi. Both versions are also rasterized, to report the
+    fraction of pixels that differ.
+    :param dim: dimension of the grid
+    :param dtype: reduced precision dtype, e.g. np.float32
+    :param num: grid points per axis
+    :param nsteps: number of intermediate steps
+    :param dpi: resolution of the frames
+    :param tolerance: largest displacement allowed, in pixels
+    :return: record dict, "passed" tells whether the tolerance is met
+    """
+    A = _matrix(dim)
+    vector = np.identity(dim + 1)[:dim]
+    grid = linspace_grid(num=num, dim=dim)
+    maxval = transform_max(A, grid)
+    size = 4 * dpi
+
+    # screen coordinates span 2.2 maxval over size - 1 pixels, see
+    # rasterizer.project; 3D frames span more, so they are bounded too
+    scale = (size - 1) / (2.2 * maxval)
+    rgb = rasterizer.to_rgb(_module(dim).colorizer(*grid))
+    vector_rgb = rasterizer.to_rgb(list(rasterizer.NAMED_COLORS)[:dim + 1])
+
+    error, differing = 0.0, 0
+    reference = iter_transform(A, vector, grid, nsteps)
+    reduced = iter_transform(A, vector, grid, nsteps, dtype=dtype)
+    for (grid64, vector64), (frame_grid, frame_vector) in zip(reference,
+                                                              reduced):
+        error = max(error, scale * np.max(np.abs(frame_grid - grid64)),
+                    scale * np.max(np.abs(frame_vector - vector64)))
+        expected = rasterizer.render_frame(grid64, vector64, rgb, maxval,
+                                           vector_rgb, size=size)
+        frame = rasterizer.render_frame(frame_grid, frame_vector, rgb, maxval,
+                                        vector_rgb, size=size)
+        differing += np.count_nonzero(np.any(frame != expected, axis=-1))
+
+    record = dict(stage="precision", dim=dim, points=grid.shape[1],
+                  nframes=nsteps + 1, dpi=dpi, dtype=np.dtype(dtype).name,
+                  max_pixel_error=error,
+                  differing_pixels=differing / (nsteps + 1) / size ** 2,
+                  passed=bool(error <= tolerance))
+    print('{stage:>20} {dim}D {dtype}: max error {max_pixel_error:.2e} px, '
+          '{differing_pixels:.2e} of the pixels differ'.format(**record))
+    return record
+
+
+def check_render(dim, num=5, nsteps=2, dpi=50):
+    """
+    Render a small transform of any dimension from every frame source
+    Stacked arrays, a stream and a frame store are each rendered with both
+    backends, with d + 1 vectors as in analysis.default_vectors; frames
+    above 3D are projected to 3D by visualization.intermediate_plots.
+    :param dim: dimension of the grid
+    :param num: grid points per axis
+    :param nsteps: number of intermediate steps
+    :param dpi: resolution of the frames
+    :return: record dict, "passed" tells whether every frame was rendered
+    """
+    A = _matrix(dim)
+    vector = np.column_stack((np.identity(dim), np.ones(dim)))
+    grid = linspace_grid(num=num, dim=dim)
+    colors = visualization.colorizer(*grid)
+    maxval = transform_max(A, grid, nsteps=nsteps)
+
+    counts = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = os.path.join(tmp, "frames")
+        visualization.stepwise_transform(A, vector, grid, nsteps, store=store)
+        sources = {
+            "batch": lambda: batched_transform(A, vector, grid, nsteps),
+            "stream": lambda: (iter_transform(A, vector, grid, nsteps), None),
+            "store": lambda: (store, None),
+        }
+        for source, frames in sources.items():
+            for backend in ("matplotlib", "raster"):
+                writer = CountingWriter()
+                transarray, transvector = frames()
+                visualization.intermediate_plots(
+                    transarray, transvector, colors, figuredpi=dpi,
+                    nframes=nsteps + 1, maxval=maxval, writer=writer,
+                    backend=backend)
+                counts.append(writer.count)
+
+    record = dict(stage="render_check", dim=dim, points=grid.shape[1],
+                  nframes=nsteps + 1, dpi=dpi, vectors=dim + 1,
+                  passed=all(count == nsteps + 1 for count in counts))
+    print('{stage:>20} {dim}D {vectors} vectors: '
+          '{}'.format('passed' if record["passed"] else 'FAILED', **record))
+    return record
+
+
+def _raises(error, function, *args, **kwargs):
+    """
+    Whether a call raises the given exception type
+    """
+    try:
+        function(*args, **kwargs)
+    except error:
+        return True
+    return False
+
+
+def check_paths():
+    """
+    Check the interpolation paths on their edge cases
+    A half-turn must rotate instead of collapsing through a singular matrix
+    halfway, a matrix without real logarithm must raise a ValueError, and
+    the adaptive frames of a path moving less than the budget must still
+    start at the identity.
+    :return: record dict, "failed" lists the failed cases
+    """
+    half_turn = np.diag([1.0, -1.0, -1.0])
+    still = adaptive_facts(1.0001 * np.identity(2), linspace_grid())
+    cases = {
+        "expm_half_turn": abs(np.linalg.det(
+            interpolate(half_turn, [0.5], mode="expm")[0])) > 0.5,
+        "polar_half_turn": abs(np.linalg.det(
+            interpolate(half_turn, [0.5], mode="polar")[0])) > 0.5,
+        "expm_defective_negative": _raises(
+            ValueError, interpolate, [[-1, 1], [0, -1]], [0.5], mode="expm"),
+        "expm_reflection": _raises(
+            ValueError, interpolate, [[1, 0], [0, -1]], [0.5], mode="expm"),
+        "adaptive_still": list(still) == [0.0, 1.0],
+    }
+
+    failed = [name for name, passed in cases.items() if not passed]
+    record = dict(stage="paths", cases=len(cases), failed=failed,
+                  passed=not failed)
+    print('{:>20} {} cases: {}'.format(
+        record["stage"], len(cases),
+        'passed' if not failed else 'FAILED ' + ', '.join(failed)))
+    return record
+
+
+def run(sweep, dims=(2, 3), dtype=np.float64):
+    """
+    Run every benchmark of a sweep
+    :param sweep: dict of SWEEPS
+    :param dims: dimensions to benchmark; those without a sweep are only
+                 checked (see check_render)
+    :param dtype: dtype of the grids and of the computation
+    :return: list of records
+    """
+    records = [check_paths()]
+    for dim in dims:
+        records.append(check_render(dim))
+        if dim not in sweep:
+            continue
+        if np.dtype(dtype) != np.float64:
+            records.append(check_precision(dim, dtype))
+        for num in sweep[dim]:
+            grid = linspace_grid(num=num, dim=dim, dtype=dtype)
+            for nsteps in sweep["nsteps"]:
+                records += bench_transform(dim, grid, nsteps)
+            records += bench_colorize(dim, grid)
+            colors = _module(dim).colorizer(*grid)
+            for dpi in sweep["dpi"]:
+                records += bench_render(dim, grid, colors, dpi)
+        for dpi in sweep["dpi"]:
+            records += bench_encode(dim, dpi)
+    return records
+
+
+if __name__ == '__main__':
+    plotting.use_headless()
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark the animation pipeline stages')
+    parser.add_argument('--quick', action='store_true',
+                        help='small sweep for a fast check')
+    parser.add_argument('--dims', type=int, nargs='+', default=[2, 3, 4],
+                        help='dimensions to check, 2 and 3 are also '
+                             'benchmarked')
+    parser.add_argument('--repeat', type=int, default=repeat,
+                        help='timed runs per benchmark, the best is kept')
+    parser.add_argument('--dtype', default='float64',
+                        help='dtype of the computation, e.g. float32')
+    parser.add_argument('--output', default='bench_results.json',
+                        help='JSON file receiving the records')
+    args = parser.parse_args()
+    repeat = args.repeat
+
+    results = run(SWEEPS["quick" if args.quick else "full"], args.dims,
+                  np.dtype(args.dtype))
+    with open(args.output, 'w') as f:
+        json.dump({"python": platform.python_version(),
+                   "numpy": np.__version__,
+                   "machine": platform.machine(),
+                   "repeat": repeat,
+                   "records": results}, f, indent=1)
+
+    failed = [record for record in results
+              if not record.get("passed", True)]
+    if any(record["stage"] == "precision" for record in failed):
+        raise SystemExit('{} frames differ from float64 by more than half a '
+                         'pixel'.format(args.dtype))
+    if failed:
+        raise SystemExit('failed checks: {}'.format(', '.join(
+            '{}D render'.format(record["dim"])
+            if record["stage"] == "render_check"
+            else ', '.join(record["failed"]) for record in failed)))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# Persistent, content-addressed cache of rendered animation frames
+#
+# A frame is keyed by a hash of everything that decides its pixels: the
+# transformed grid and vectors of that frame, the colors, the axis limits,
+# the resolution and the render style. Re-running an animation after
+# changing only its output name or frame delay, or with more or fewer
+# steps along the same path, reuses every frame already rendered.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def run_directory(base="png-frames"):
+    """
+    Create a fresh directory for the frames of one run
+    Frames of earlier runs (possibly with more steps) can then never end up
+    in the animation of this one.
+    :param base: parent directory
+    :return: path of the new directory
+    """
+    if not os.path.exists(base):
+        os.makedirs(base)
+    prefix = time.strftime("run-%Y%m%d-%H%M%S-")
+    return tempfile.mkdtemp(prefix=prefix, dir=base)
+
+
+class FrameCache:
+    """
+    On-disk png cache with a size bound and least recently used eviction
+    Entries are plain png files under root; a hit refreshes the file's
+    modification time, which orders the eviction.
+    """
+
+    def __init__(self, root=".frame_cache", max_bytes=1 << 30):
+        """
+        :param root: cache directory
+        :param max_bytes: size above which the oldest frames are evicted
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(*parts):
+        """
+        Hash arrays, strings and numbers into a cache key
+        :param parts: values deciding the content of a frame
+        :return: hex digest
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                part = np.ascontiguousarray(part)
+                digest.update(str((part.dtype, part.shape)).encode())
+                digest.update(part.data)
+            else:
+                digest.update(repr(part).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        """
+        File of a cache entry
+        """
+        return os.path.join(self.root, key[:2], key + ".png")
+
+    def fetch(self, key, outfile=None):
+        """
+        Look a frame up
+        :param key: cache key
+        :param outfile: copy the cached png there, otherwise decode it
+        :return: outfile or an RGBA array on a hit, None on a miss
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        if outfile is not None:
+            shutil.copyfile(path, outfile)
+            return outfile
+        with Image.open(path) as image:
+            return np.array(image.convert("RGBA"))
+
+    def store(self, key, frame):
+        """
+        Add a frame to the cache
+        :param key: cache key
+        :param frame: path of a png file, or an RGBA array
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write next to the entry and rename, so that concurrent workers
+        # never see a partial file
+        fd, tmp = tempfile.mkstemp(suffix=".png", dir=os.path.dirname(path))
+        os.close(fd)
+        if isinstance(frame, str):
+            shutil.copyfile(frame, tmp)
+        else:
+            Image.fromarray(np.asarray(frame)).save(tmp, compress_level=1)
+        os.replace(tmp, path)
+
+    def evict(self):
+        """
+        Delete the least recently used frames until the cache fits max_bytes
+        """
+        entries = []
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
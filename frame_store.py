@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# On-disk, memory-mapped stacks of transformed frames
+#
+# A frame store is a directory holding the (nsteps + 1, d, n) transformed
+# grid and the (nsteps + 1, d, m) transformed vectors as .npy files, plus
+# a small meta.json (largest coordinate, matrix, mode). The stacks are
+# written a block at a time, so they can be far larger than the memory, and
+# read back with np.load(mmap_mode='r'): renderers and worker processes map
+# the same pages instead of pickling frames, and one computed trajectory can
+# be rendered in several styles.
+
+import json
+import os
+
+import numpy as np
+
+from transform_engine import interpolated_matrices
+
+
+def write_frames(path, A, vector, grid, nsteps=50, mode="linear", dtype=None,
+                 window=8, chunksize=1 << 20, facts=None):
+    """
+    Compute every intermediate transform into a frame store
+    :param path: directory of the store, created if necessary
+    :param A: d-by-d matrix
+    :param vector: d-by-m array of vectors
+    :param grid: d-by-n array of coordinates
+    :param nsteps: number of intermediate steps
+    :param mode: interpolation path, see transform_engine
+    :param dtype: dtype of the computation and of the files (float64 by
+                  default)
+    :param window: number of frames computed per block
+    :param chunksize: number of points computed per block
+    :param facts: interpolation parameters of the frames, replacing the
+                  nsteps + 1 uniform ones
+    :return: (transgrid, transvector) read-only memory maps, see open_frames
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    matrices = interpolated_matrices(A, nsteps, dtype=dtype, mode=mode,
+                                     facts=facts)
+    nframes = len(matrices)
+    grid = np.asarray(grid, dtype=matrices.dtype)
+    vector = np.asarray(vector, dtype=matrices.dtype)
+
+    transgrid = np.lib.format.open_memmap(
+        os.path.join(path, "grid.npy"), mode="w+", dtype=matrices.dtype,
+        shape=(nframes,) + grid.shape)
+    transvector = np.lib.format.open_memmap(
+        os.path.join(path, "vector.npy"), mode="w+", dtype=matrices.dtype,
+        shape=(nframes,) + vector.shape)
+
+    # blocks of consecutive frames are written front to back, so the pages
+    # of the files are filled in order
+    maxval = -np.inf
+    for start in range(0, nframes, window):
+        block = matrices[start:start + window]
+        for first in range(0, grid.shape[1], chunksize):
+            out = transgrid[start:start + window, :, first:first + chunksize]
+            np.matmul(block, grid[:, first:first + chunksize], out=out)
+            maxval = max(maxval, float(out.max()))
+        np.matmul(block, vector, out=transvector[start:start + window])
+
+    transgrid.flush()
+    transvector.flush()
+    del transgrid, transvector
+
+    with open(os.path.join(path, "meta.json"), 'w') as f:
+        json.dump({"maxval": maxval, "nsteps": nframes - 1, "mode": mode,
+                   "matrix": np.asarray(A, dtype=np.float64).tolist()}, f)
+
+    return open_frames(path)
+
+
+def open_frames(path):
+    """
+    Map the stacks of a frame store without reading them
+    :param path: directory written by write_frames
+    :return: (nsteps + 1)-by-d-by-n and (nsteps + 1)-by-d-by-m read-only
+             memory maps
+    """
+    return (np.load(os.path.join(path, "grid.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "vector.npy"), mmap_mode="r"))
+
+
+def read_meta(path):
+    """
+    Metadata of a frame store
+    :param path: directory written by write_frames
+    :return: dict with the largest coordinate "maxval", "nsteps", "mode" and
+             "matrix"
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# Construction of the point grids animated by the visualizations
+#
+# Every function returns a d-by-n array, the layout expected by
+# stepwise_transform, built with broadcasting instead of Python loops.
+
+import numpy as np
+
+
+def rectilinear_grid(*axes, dtype=np.float64):
+    """
+    Grid of every combination of the given axis values
+    Points are ordered like the nested comprehension
+    [[x, y] for x in xvals for y in yvals]: the first axis varies slowest.
+    The axes need not be uniform.
+    :param axes: one 1D array of values per dimension
+    :param dtype: dtype of the grid
+    :return: d-by-n array, n being the product of the axis lengths
+    """
+    axes = [np.asarray(values, dtype=dtype) for values in axes]
+    shape = tuple(len(values) for values in axes)
+
+    grid = np.empty((len(axes),) + shape, dtype=dtype)
+    for k, values in enumerate(axes):
+        # broadcast the axis along its own dimension only
+        grid[k] = values.reshape((-1,) + (1,) * (len(axes) - k - 1))
+
+    return grid.reshape(len(axes), -1)
+
+
+def linspace_grid(low=-4, high=4, num=9, dim=2, dtype=np.float64):
+    """
+    Uniform grid with the same linspace along every dimension
+    :param low: smallest coordinate
+    :param high: largest coordinate
+    :param num: number of values per dimension
+    :param dim: number of dimensions
+    :param dtype: dtype of the grid
+    :return: d-by-(num ** dim) array
+    """
+    values = np.linspace(low, high, num)
+    return rectilinear_grid(*[values] * dim, dtype=dtype)
+
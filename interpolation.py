@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# Interpolation paths from the identity to a matrix A
+#
+# "linear"  I + t (A - I), the original straight line between matrices
+# "expm"    expm(t logm(A)), the geodesic: rotations keep their shape
+# "polar"   R(t) P(t) from the polar decomposition A = R P, rotating with
+#           the rotation part while stretching linearly with P
+#
+# The factorizations are computed once per matrix and cached, on top of the
+# cached spectral data of analysis.py, so every frame only costs a few small
+# batched products.
+
+import functools
+
+import numpy as np
+
+import analysis
+
+MODES = ("linear", "expm", "polar")
+
+
+def _sqrtm(A):
+    """
+    Principal square root by the Denman-Beavers iteration
+    :param A: d-by-d matrix without eigenvalues on the closed negative axis
+    :return: d-by-d array
+    """
+    Y, Z = A, np.identity(A.shape[0])
+    for _ in range(100):
+        try:
+            Y, Z = (Y + np.linalg.inv(Z)) / 2, (Z + np.linalg.inv(Y)) / 2
+        except np.linalg.LinAlgError:
+            # the iteration hits a singular matrix on the negative axis
+            break
+        if np.linalg.norm(np.matmul(Y, Y) - A) <= 1e-13 * np.linalg.norm(A):
+            return Y
+    raise ValueError("matrix has no real principal logarithm")
+
+
+def _logm(A, tol=0.25):
+    """
+    Real matrix logarithm by inverse scaling and squaring
+    Used for defective matrices (e.g. shears), where the eigendecomposition
+    cannot be trusted.
+    :param A: d-by-d matrix without eigenvalues on the closed negative axis
+    :return: d-by-d array
+    """
+    Iden = np.identity(A.shape[0])
+    Y, squarings = A, 0
+    while np.linalg.norm(Y - Iden, 2) > tol:
+        Y, squarings = _sqrtm(Y), squarings + 1
+
+    # Mercator series of log(I + X), fast for ||X|| <= tol
+    X = Y - Iden
+    term, L = Iden, np.zeros_like(X)
+    for k in range(1, 40):
+        term = np.matmul(term, X)
+        L += (-1) ** (k + 1) * term / k
+
+    return 2 ** squarings * L
+
+
+def _expm(stack):
+    """
+    Matrix exponential of a stack of matrices by scaling and squaring
+    :param stack: k-by-d-by-d array
+    :return: k-by-d-by-d array
+    """
+    norm = np.max(np.abs(stack).sum(axis=-1))
+    squarings = max(0, int(np.ceil(np.log2(norm))) + 1) if norm > 0 else 0
+    scaled = stack / 2 ** squarings
+
+    # Taylor series, converges quickly once the norm is below 1/2
+    Iden = np.identity(stack.shape[-1])
+    term = np.broadcast_to(Iden, stack.shape)
+    result = term.copy()
+    for k in range(1, 18):
+        term = np.matmul(term, scaled) / k
+        result += term
+
+    for _ in range(squarings):
+        result = np.matmul(result, result)
+    return result
+
+
+def _real_path(w, V):
+    """
+    Real basis in which a diagonalizable matrix is block diagonal, and the
+    rotations and scalings of a path of invertible matrices to it
+    In that basis, a positive eigenvalue scales its eigenvector, a complex
+    pair rotates and scales the plane of the real and imaginary parts of
+    its eigenvector, and a pair of negative eigenvalues (a half-turn)
+    rotates the plane of their eigenvectors by pi while scaling them. The
+    matrix at t is then B R(t) diag(exp(t logs)) B^-1.
+    :param w: eigenvalues
+    :param V: eigenvectors, as columns
+    :return: (logs, list of (i, j, angle) rotation planes of the columns of
+             B, B, B^-1)
+    """
+    logs, columns, planes, negative = [], [], [], []
+    for value, vector in zip(w, V.T):
+        if abs(value.imag) <= analysis.REAL_TOL:
+            if value.real < 0:
+                negative.append((value.real, vector.real))
+            else:
+                logs.append(np.log(value.real))
+                columns.append(vector.real)
+        elif value.imag > 0:
+            # A x = a x - b y and A y = b x + a y for the eigenvector x + iy
+            planes.append((len(columns), len(columns) + 1, -np.angle(value)))
+            logs += [np.log(abs(value))] * 2
+            columns += [vector.real, vector.imag]
+
+    if len(negative) % 2:
+        raise ValueError("a reflection cannot be reached through invertible "
+                         "matrices, use linear interpolation")
+    for (a, u), (b, v) in zip(negative[::2], negative[1::2]):
+        planes.append((len(columns), len(columns) + 1, np.pi))
+        logs += [np.log(-a), np.log(-b)]
+        columns += [u, v]
+
+    B = np.column_stack(columns)
+    return np.array(logs), planes, B, np.linalg.inv(B)
+
+
+def _path_matrices(path, facts):
+    """
+    Matrices of a path returned by _real_path
+    :param path: (logs, planes, B, B^-1)
+    :param facts: 1D array of interpolation parameters
+    :return: len(facts)-by-d-by-d array
+    """
+    logs, planes, B, Binv = path
+    d = len(logs)
+    blocks = np.zeros((len(facts), d, d))
+    blocks[:, np.arange(d), np.arange(d)] = np.exp(facts[:, None] * logs)
+    for i, j, angle in planes:
+        c = np.cos(facts * angle)[:, None]
+        s = np.sin(facts * angle)[:, None]
+        rowi, rowj = blocks[:, i].copy(), blocks[:, j].copy()
+        blocks[:, i] = c * rowi - s * rowj
+        blocks[:, j] = s * rowi + c * rowj
+    return np.matmul(np.matmul(B, blocks), Binv)
+
+
+@functools.lru_cache(maxsize=256)
+def _decompose(mode, data, shape):
+    """
+    Cached factorization of a matrix for the given interpolation mode
+    :param mode: "expm" or "polar"
+    :param data: bytes of the float64 matrix
+    :param shape: shape of the matrix
+    :return: tuple of arrays, see _evaluate
+    """
+    A = np.frombuffer(data).reshape(shape)
+    spectrum = analysis.analyze(A)
+
+    if mode == "expm":
+        if abs(spectrum.det) < 1e-12:
+            raise ValueError("expm interpolation needs an invertible matrix")
+        w, V = spectrum.eigenvalues, spectrum.eigenvectors
+        if np.linalg.cond(V) < 1e8:
+            # diagonalizable: A^t in the real basis of its rotation planes
+            return ("eig",) + _real_path(w, V)
+        if np.any((np.abs(w.imag) <= analysis.REAL_TOL) & (w.real < 0)):
+            # a defective negative eigenvalue has no real logarithm
+            raise ValueError("matrix has no real principal logarithm")
+        return "log", _logm(A)
+
+    # polar: A = U P with U orthogonal and P symmetric, from the SVD
+    W, s, Vh = spectrum.svd
+    if np.linalg.det(W) * np.linalg.det(Vh) < 0:
+        # keep a proper rotation, the reflection goes into the stretch
+        W = W.copy()
+        W[:, -1] *= -1
+        s = s.copy()
+        s[-1] *= -1
+    U = np.matmul(W, Vh)
+    # a proper rotation: its negative eigenvalues come in half-turn pairs
+    return ("polar",) + _real_path(*np.linalg.eig(U)) + (s, Vh)
+
+
+def _evaluate(parts, facts):
+    """
+    Intermediate matrices of a cached factorization
+    :param parts: factorization returned by _decompose
+    :param facts: 1D array of interpolation parameters
+    :return: len(facts)-by-d-by-d array
+    """
+    kind = parts[0]
+    if kind == "log":
+        return _expm(facts[:, None, None] * parts[1])
+
+    powers = _path_matrices(parts[1:5], facts)
+    if kind == "eig":
+        return powers
+
+    s, Vh = parts[5:]
+    stretch = np.matmul(Vh.T * (1 + facts[:, None] * (s - 1))[:, None, :], Vh)
+    return np.matmul(powers, stretch)
+
+
+def interpolate(A, facts, mode="linear"):
+    """
+    Matrices along the path from the identity (t = 0) to A (t = 1)
+    Pairs of negative eigenvalues (half-turns) rotate by pi in the plane of
+    their eigenvectors; "expm" raises a ValueError for a reflection (an odd
+    number of them), which no path of invertible matrices reaches, and for
+    a defective matrix with a negative eigenvalue (no real logarithm).
+    :param A: d-by-d matrix
+    :param facts: 1D array of interpolation parameters t
+    :param mode: one of MODES
+    :return: len(facts)-by-d-by-d float64 array
+    """
+    A = np.asarray(A, dtype=np.float64)
+    facts = np.asarray(facts, dtype=np.float64)
+
+    if mode == "linear":
+        Iden = np.identity(A.shape[0])
+        return Iden + facts[:, None, None] * (A - Iden)
+    if mode not in MODES:
+        raise ValueError("unknown interpolation mode: " + str(mode))
+
+    A = np.ascontiguousarray(A)
+    return _evaluate(_decompose(mode, A.tobytes(), A.shape), facts)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# Interactive live preview of a linear transformation
+#
+# Usage: python live_preview.py "3 1; 0 2" [--mode expm] [--nsteps 50]
+#
+# Instead of rendering every frame to png files and encoding an animation,
+# the transformation is played in a window at display rate: the grid and its
+# colors are built once, each frame only moves the points and the arrows of
+# the same artists, and only those artists are redrawn (blitting).
+#
+# Drag the slider to scrub the interpolation parameter, press space to play
+# or pause, and type a new matrix (rows separated by ";") to swap it in
+# without rebuilding the grid or the colors. 3D grids are drawn with the 3D
+# view of the raster backend; grids of more dimensions are projected first.
+
+import argparse
+
+import numpy as np
+
+import analysis
+import plotting
+import rasterizer
+import visualization
+from grids import linspace_grid
+from interpolation import MODES, interpolate
+from transform_engine import interpolated_matrices, transform_max
+
+
+def parse_matrix(text):
+    """
+    Read a square matrix typed as rows separated by ";"
+    :param text: e.g. "3 1; 0 2" (commas between values are allowed)
+    :return: d-by-d float64 array
+    """
+    rows = [row.replace(',', ' ').split() for row in text.split(';')]
+    A = np.array(rows, dtype=np.float64)
+    if A.ndim != 2 or A.shape[0] != A.shape[1]:
+        raise ValueError("not a square matrix: " + text)
+    return A
+
+
+def format_matrix(A):
+    """
+    Inverse of parse_matrix
+    """
+    return '; '.join(' '.join('{:g}'.format(value) for value in row)
+                     for row in A)
+
+
+class LivePreview:
+    """
+    Window playing a transformation with blitted artists
+    The interpolated matrices of a transformation are computed once; a
+    played frame then costs one product with the grid, a scrubbed one also
+    interpolates the matrix at its own parameter.
+    """
+
+    def __init__(self, A, grid, vectors=None, colors=None, mode="linear",
+                 nsteps=50, interval=20, elev=30, azim=-60):
+        """
+        :param A: d-by-d matrix
+        :param grid: d-by-n array of coordinates
+        :param vectors: d-by-m array of vectors drawn as arrows, by default
+                        the basis and an eigenvector of each matrix
+        :param colors: colors of the grid points, visualization.colorizer
+                       by default
+        :param mode: interpolation path, see interpolation.py
+        :param nsteps: number of steps of the played transformation
+        :param interval: delay between played frames in milliseconds
+        :param elev: elevation of the 3D view in degrees
+        :param azim: azimuth of the 3D view in degrees
+        """
+        self.grid = np.asarray(grid)
+        if colors is None:
+            colors = visualization.colorizer(*self.grid)
+        self.colors = colors
+        self.fixed_vectors = vectors
+        self.mode = mode
+        self.nsteps = nsteps
+        self.interval = interval
+
+        # screen coordinates: 2D as is, otherwise through the 3D view
+        dim = len(self.grid)
+        if dim == 2:
+            self.screen = np.identity(2)
+        else:
+            self.screen = np.matmul(rasterizer.view_matrix(elev, azim)[:2],
+                                    visualization.projection(dim))
+
+        self.t = 0.0
+        # frame index, and position in the back and forth cycle of frames
+        self.step = self.phase = 0
+        self.playing = True
+        self.fig = None
+        self.set_matrix(A)
+
+    def set_matrix(self, A):
+        """
+        Swap in a new matrix, keeping the grid and the colors
+        :param A: d-by-d matrix of the dimension of the grid
+        """
+        A = np.asarray(A, dtype=np.float64)
+        if A.shape != (len(self.grid),) * 2:
+            raise ValueError("expected a {0}-by-{0} matrix"
+                             .format(len(self.grid)))
+
+        self.matrices = interpolated_matrices(A, self.nsteps, mode=self.mode)
+        self.A = A
+        self.vectors = self.fixed_vectors
+        if self.vectors is None:
+            self.vectors = analysis.default_vectors(A)
+        self.maxval = np.abs(transform_max(A, self.grid, mode=self.mode,
+                                           nsteps=self.nsteps))
+
+        if self.fig is not None:
+            self._set_limits()
+            self._draw(self._matrix())
+            # limits changed: redraw the background the artists are
+            # blitted onto
+            self.fig.canvas.draw()
+
+    def _matrix(self):
+        """
+        Interpolated matrix at the current parameter
+        """
+        if self.playing or self.t == self.step / self.nsteps:
+            return self.matrices[self.step]
+        return interpolate(self.A, [self.t], mode=self.mode)[0]
+
+    def _set_limits(self):
+        """
+        Fix the extent of the axes, as the renderers do
+        In 3D and more, the extent is the half width of the projected cube
+        of half side 1.1 maxval, as in rasterizer.project.
+        """
+        extent = 1.1 * self.maxval * np.max(np.sum(np.abs(self.screen),
+                                                   axis=1))
+        self.ax.set_xlim(-extent, extent)
+        self.ax.set_ylim(-extent, extent)
+
+    def _draw(self, matrix):
+        """
+        Move the points and the arrows to a frame
+        :param matrix: d-by-d interpolated matrix
+        """
+        S = np.matmul(self.screen, matrix)
+        grid = np.matmul(S, self.grid)
+        vector = np.matmul(S, self.vectors)
+
+        self.scatter.set_offsets(grid.T)
+        self.quiver.set_UVC(vector[0], vector[1])
+        self.label.set_text('t = {:.2f}'.format(self.t))
+
+    def _tick(self, number):
+        """
+        Advance the played transformation by one frame, back and forth
+        :return: the artists to blit
+        """
+        if self.playing:
+            self.phase = (self.phase + 1) % (2 * self.nsteps)
+            self.step = min(self.phase, 2 * self.nsteps - self.phase)
+            self.t = self.step / self.nsteps
+            self._draw(self.matrices[self.step])
+        return self.scatter, self.quiver, self.label
+
+    def _scrub(self, t):
+        """
+        Show the frame at a parameter chosen with the slider
+        """
+        self.playing = False
+        self.t = t
+        self.step = self.phase = int(round(t * self.nsteps))
+        self._draw(self._matrix())
+
+    def _submit(self, text):
+        """
+        Swap in a matrix typed in the text box
+        """
+        try:
+            self.set_matrix(parse_matrix(text))
+        except (ValueError, np.linalg.LinAlgError) as error:
+            self.label.set_text(str(error))
+
+    def _key(self, event):
+        """
+        Play or pause with the space bar
+        """
+        if event.key == ' ' and not self.textbox.capturekeystrokes:
+            self.playing = not self.playing
+
+    def show(self):
+        """
+        Open the window and play the transformation until it is closed
+        """
+        plt = plotting.pyplot()
+        from matplotlib.animation import FuncAnimation
+        from matplotlib.widgets import Slider, TextBox
+
+        self.fig = plt.figure(figsize=(5, 5.8), facecolor="w")
+        self.ax = self.fig.add_axes([0.1, 0.22, 0.85, 0.73])
+        self.ax.set_facecolor('black')
+        self.ax.set_aspect('equal')
+        self._set_limits()
+
+        # animated artists are left out of full redraws and blitted instead
+        points = np.zeros(self.grid.shape[1])
+        self.scatter = self.ax.scatter(points, points, s=16, c=self.colors,
+                                       edgecolor="none", animated=True)
+        origin = np.zeros(self.vectors.shape[1])
+        self.quiver = self.ax.quiver(origin, origin, origin, origin,
+                                     angles='xy', scale_units='xy', scale=1,
+                                     color=visualization.vector_colors(
+                                         len(self.grid),
+                                         self.vectors.shape[1]),
+                                     animated=True)
+        self.label = self.ax.text(0.02, 0.97, '', color='white', va='top',
+                                  transform=self.ax.transAxes, animated=True)
+        self._draw(self._matrix())
+
+        self.slider = Slider(self.fig.add_axes([0.15, 0.11, 0.7, 0.03]),
+                             't', 0, 1, valinit=0)
+        self.slider.on_changed(self._scrub)
+        self.textbox = TextBox(self.fig.add_axes([0.15, 0.03, 0.7, 0.05]),
+                               'A', initial=format_matrix(self.A))
+        self.textbox.on_submit(self._submit)
+        self.fig.canvas.mpl_connect('key_press_event', self._key)
+
+        self.animation = FuncAnimation(self.fig, self._tick,
+                                       interval=self.interval, blit=True,
+                                       cache_frame_data=False)
+        plt.show()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Play a linear transformation in a window')
+    parser.add_argument('matrix', help='rows separated by ";", '
+                                       'e.g. "3 1; 0 2"')
+    parser.add_argument('--mode', default='linear', choices=MODES)
+    parser.add_argument('--nsteps', type=int, default=50,
+                        help='steps of the played transformation')
+    parser.add_argument('--num', type=int, default=9,
+                        help='grid values per dimension')
+    args = parser.parse_args()
+
+    A = parse_matrix(args.matrix)
+    LivePreview(A, linspace_grid(num=args.num, dim=len(A)), mode=args.mode,
+                nsteps=args.nsteps).show()
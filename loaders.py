@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# Point grids loaded from files: point clouds, meshes and images
+#
+# Besides the synthetic lattices of grids.py, the animations can move real
+# data:
+#   .npy    n-by-d point clouds (d-by-n with layout="columns")
+#   .ply    vertices of a PLY mesh or point cloud (ascii or binary), with
+#           their red/green/blue colors when the file has them
+#   .obj    vertices of a Wavefront OBJ mesh, with "v x y z r g b" colors
+#           when present
+#   images  (.png, .jpg, ...) every pixel is a 2D point of its own color
+#
+# An input is read a chunk of points at a time (images are first decoded
+# whole by PIL, in a fraction of the size of their points) into a point
+# store: a directory holding the d-by-n grid and the n-by-3 colors as .npy
+# files, mapped back with np.load(mmap_mode='r') as in frame_store.py. The
+# transforms and renderers then read the points from the page cache instead
+# of holding a copy of them all:
+#
+#     grid, colors = load("scan.ply", "scan-points")
+#     frames = iter_transform(A, vectors, grid, window=1, dtype=grid.dtype)
+
+import functools
+import itertools
+import os
+
+import numpy as np
+from PIL import Image
+
+import visualization
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif',
+                    '.tiff', '.webp')
+
+# PLY property types
+_PLY_TYPES = {'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+              'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+              'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+              'float': 'f4', 'float32': 'f4', 'double': 'f8',
+              'float64': 'f8'}
+
+
+def open_points(path):
+    """
+    Map the grid and the colors of a point store without reading them
+    :param path: directory written by load
+    :return: d-by-n and n-by-3 read-only memory maps
+    """
+    return (np.load(os.path.join(path, "grid.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "colors.npy"), mmap_mode="r"))
+
+
+def _create(path, dim, npoints, dtype):
+    """
+    Create the writable memory maps of a new point store
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+    grid = np.lib.format.open_memmap(
+        os.path.join(path, "grid.npy"), mode="w+", dtype=dtype,
+        shape=(dim, npoints))
+    colors = np.lib.format.open_memmap(
+        os.path.join(path, "colors.npy"), mode="w+", dtype=np.float32,
+        shape=(npoints, 3))
+    return grid, colors
+
+
+def _normalize(grid, extent, chunksize):
+    """
+    Center the points on their bounding box and scale them into
+    [-extent, extent], in place and chunk by chunk
+    """
+    low = np.full(len(grid), np.inf)
+    high = np.full(len(grid), -np.inf)
+    for start in range(0, grid.shape[1], chunksize):
+        chunk = grid[:, start:start + chunksize]
+        low = np.minimum(low, chunk.min(axis=1))
+        high = np.maximum(high, chunk.max(axis=1))
+
+    center = (low + high) / 2
+    half = np.max(high - low) / 2
+    scale = extent / half if half > 0 else 1.0
+    for start in range(0, grid.shape[1], chunksize):
+        chunk = grid[:, start:start + chunksize]
+        chunk[...] = (chunk - center[:, None]) * scale
+
+
+def _colorize(grid, colors, chunksize):
+    """
+    Fill the colors of points without their own with the default palette
+    """
+    for start in range(0, grid.shape[1], chunksize):
+        colors[start:start + chunksize] = visualization.colorizer(
+            *grid[:, start:start + chunksize])
+
+
+def _read_npy(path, store, dtype, chunksize, layout="rows"):
+    """
+    Copy a .npy point cloud into a point store
+    :param layout: "rows" for an n-by-d array (one point per row),
+                   "columns" for a d-by-n one
+    :return: (grid, colors, whether the colors were read)
+    """
+    if layout not in ("rows", "columns"):
+        raise ValueError("unknown layout: " + layout)
+    points = np.load(path, mmap_mode="r")
+    if points.ndim != 2:
+        raise ValueError("expected a 2D array of points: " + path)
+    if layout == "rows":
+        points = points.T
+
+    grid, colors = _create(store, points.shape[0], points.shape[1], dtype)
+    for start in range(0, grid.shape[1], chunksize):
+        grid[:, start:start + chunksize] = points[:, start:start + chunksize]
+    return grid, colors, False
+
+
+def _ply_header(f):
+    """
+    Parse the header of a PLY file
+    :return: (format, list of (element, count, list of (property, type or
+             None for a list property)), size of the header in bytes)
+    """
+    if f.readline().strip() != b'ply':
+        raise ValueError("not a PLY file")
+
+    fmt, elements = None, []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError("PLY header without end_header")
+        words = line.decode('ascii').split()
+        if not words or words[0] in ('comment', 'obj_info'):
+            continue
+        if words[0] == 'end_header':
+            return fmt, elements, f.tell()
+        if words[0] == 'format':
+            fmt = words[1]
+        elif words[0] == 'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == 'property':
+            kind = None if words[1] == 'list' else _PLY_TYPES[words[1]]
+            elements[-1][2].append((words[-1], kind))
+
+
+def _read_ply(path, store, dtype, chunksize):
+    """
+    Copy the vertices of a PLY file into a point store
+    Binary vertices are mapped in place, ascii ones parsed a chunk of lines
+    at a time. The vertex element must come first, as usual.
+    :return: (grid, colors, whether the colors were read)
+    """
+    with open(path, 'rb') as f:
+        fmt, elements, offset = _ply_header(f)
+    if not elements or elements[0][0] != 'vertex':
+        raise ValueError("PLY file without leading vertex element: " + path)
+    _, count, properties = elements[0]
+    names = [name for name, _ in properties]
+    if any(kind is None for _, kind in properties):
+        raise ValueError("list properties of vertices are not supported")
+
+    axes = [name for name in ('x', 'y', 'z') if name in names]
+    rgb = [name for name in ('red', 'green', 'blue') if name in names]
+    grid, colors = _create(store, len(axes), count, dtype)
+
+    def fill(start, values):
+        stop = start + len(values[axes[0]])
+        for k, name in enumerate(axes):
+            grid[k, start:stop] = values[name]
+        if len(rgb) == 3:
+            for k, name in enumerate(rgb):
+                channel = np.asarray(values[name], dtype=np.float32)
+                if dict(properties)[name].startswith('u'):
+                    channel = channel / 255
+                colors[start:stop, k] = channel
+
+    if fmt == 'ascii':
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for start in range(0, count, chunksize):
+                lines = [line.decode('ascii') for line in itertools.islice(
+                    f, min(chunksize, count - start))]
+                table = np.loadtxt(lines, ndmin=2)
+                fill(start, {name: table[:, k]
+                             for k, name in enumerate(names)})
+    else:
+        order = '<' if fmt == 'binary_little_endian' else '>'
+        vertex = np.dtype([(name, order + kind)
+                           for name, kind in properties])
+        vertices = np.memmap(path, dtype=vertex, mode='r', offset=offset,
+                             shape=(count,))
+        for start in range(0, count, chunksize):
+            fill(start, vertices[start:start + chunksize])
+
+    return grid, colors, len(rgb) == 3
+
+
+def _read_obj(path, store, dtype, chunksize):
+    """
+    Copy the vertices of an OBJ file into a point store, in two passes over
+    the file: one to count them, one to parse them a chunk at a time
+    :return: (grid, colors, whether the colors were read)
+    """
+    def vertices(f):
+        return (line for line in f if line.split()[:1] == ['v'])
+
+    with open(path) as f:
+        count = sum(1 for _ in vertices(f))
+    if not count:
+        raise ValueError("OBJ file without vertices: " + path)
+    with open(path) as f:
+        hascolor = len(next(vertices(f)).split()) >= 7
+    grid, colors = _create(store, 3, count, dtype)
+
+    with open(path) as f:
+        lines = vertices(f)
+        for start in range(0, count, chunksize):
+            table = np.array([line.split()[1:7 if hascolor else 4]
+                              for line in itertools.islice(lines, chunksize)],
+                             dtype=np.float64)
+            stop = start + len(table)
+            grid[:, start:stop] = table[:, :3].T
+            if hascolor:
+                colors[start:stop] = table[:, 3:6]
+
+    return grid, colors, hascolor
+
+
+def _read_image(path, store, dtype, chunksize, extent=4, step=1):
+    """
+    Turn every step-th pixel of an image into a 2D point of its color
+    The image spans [-extent, extent] along its longer side, y upwards.
+    PIL decodes the whole image at once, 3 bytes per pixel (far less than
+    the 20 bytes of its point), JPEG directly at a reduced scale when
+    step > 1; the points are then written a band of rows at a time.
+    :return: (grid, colors, True)
+    """
+    image = Image.open(path)
+    width, height = image.size
+    cols = np.arange(0, width, step)
+    rows = np.arange(0, height, step)
+    scale = 2 * extent / max(width - 1, height - 1, 1)
+
+    if step > 1:
+        # JPEG decodes at 1/2, 1/4 or 1/8 scale, other formats ignore it
+        image.draft('RGB', (len(cols), len(rows)))
+    image = image.convert('RGB')
+    if image.size != (len(cols), len(rows)):
+        image = image.resize((len(cols), len(rows)), Image.NEAREST)
+    pixels = np.asarray(image)
+
+    grid, colors = _create(store, 2, len(cols) * len(rows), dtype)
+    band = max(1, chunksize // len(cols))
+    for first in range(0, len(rows), band):
+        bandrows = rows[first:first + band]
+        start = first * len(cols)
+        stop = start + len(bandrows) * len(cols)
+        grid[0, start:stop] = np.tile((cols - (width - 1) / 2) * scale,
+                                      len(bandrows))
+        grid[1, start:stop] = np.repeat(((height - 1) / 2 - bandrows)
+                                        * scale, len(cols))
+        colors[start:stop] = pixels[first:first + band].reshape(-1, 3) / 255
+
+    return grid, colors, True
+
+
+def load(path, store, normalize=True, extent=4, dtype=np.float32,
+         chunksize=1 << 20, step=1, layout="rows"):
+    """
+    Read points from a file into a memory-mapped point store
+    Points without colors of their own get the default palette of
+    visualization.colorizer.
+    :param path: .npy, .ply or .obj file, or an image
+    :param store: directory of the point store, removed by the caller once
+                  the points are no longer needed
+    :param normalize: center point clouds and meshes on their bounding box
+                      and scale them into [-extent, extent] like the
+                      synthetic grids (images always are)
+    :param extent: largest coordinate after normalization
+    :param dtype: dtype of the grid; float32 halves the memory and
+                  bandwidth, far below a pixel at usual sizes
+    :param chunksize: number of points read and written at once
+    :param step: keep one pixel every step along each axis (images only)
+    :param layout: "rows" when a .npy array holds one point per row
+                   (n-by-d), "columns" when it holds one per column (d-by-n)
+    :return: (d-by-n grid, n-by-3 float32 colors) read-only memory maps
+    """
+    readers = {'.npy': functools.partial(_read_npy, layout=layout),
+               '.ply': _read_ply, '.obj': _read_obj}
+    extension = os.path.splitext(path)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        grid, colors, hascolor = _read_image(path, store, dtype, chunksize,
+                                             extent, step)
+    elif extension in readers:
+        grid, colors, hascolor = readers[extension](path, store, dtype,
+                                                    chunksize)
+        if normalize:
+            _normalize(grid, extent, chunksize)
+    else:
+        raise ValueError("unsupported point file: " + path)
+
+    if not hascolor:
+        _colorize(grid, colors, chunksize)
+
+    grid.flush()
+    colors.flush()
+    del grid, colors
+    return open_points(store)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Pipelined execution of the render stages on threads
+#
+# Frame generation, rendering and encoding run strictly one after another
+# per frame when called in a loop. Here each stage runs on its own thread
+# and hands its results to the next one through a bounded queue: a stage
+# that gets ahead blocks once its queue is full (backpressure), so memory
+# stays bounded by the queue sizes and the wall time approaches that of the
+# slowest stage instead of the sum of all of them.
+#
+#     run(frames, render, encode, maxsize=4)
+#
+# The heavy parts of every stage (BLAS products, Agg drawing buffers, PIL
+# quantization, zlib) spend most of their time outside the GIL, so the
+# threads do overlap.
+
+import queue
+import threading
+
+# marks the end of a stream between two stages
+_DONE = object()
+
+# seconds between checks for a failed stage while waiting on a queue
+_POLL = 0.1
+
+
+def _put(q, item, stop):
+    """
+    Put an item in a queue, waiting while it is full
+    :return: False when the pipeline stopped meanwhile
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop):
+    """
+    Take an item from a queue, waiting while it is empty
+    :return: the item, or _DONE when the pipeline stopped meanwhile
+    """
+    while True:
+        try:
+            return q.get(timeout=_POLL)
+        except queue.Empty:
+            if stop.is_set():
+                return _DONE
+
+
+def _stream(q, stop):
+    """
+    Items of a queue up to the end of the stream
+    """
+    while True:
+        item = _get(q, stop)
+        if item is _DONE:
+            return
+        yield item
+
+
+def run(source, *stages, maxsize=4):
+    """
+    Run a source and a chain of stages concurrently, one thread each
+    Every stage maps one item to an iterable of items for the next stage
+    (possibly empty); the items of the last stage are dropped. Items keep
+    their order. The first exception raised by the source or a stage stops
+    the whole pipeline and is raised again here.
+    :param source: iterable of items, iterated on its own thread
+    :param stages: functions of an item returning an iterable of items
+    :param maxsize: capacity of the queue between two stages
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize) for _ in stages]
+
+    def feed(items, out):
+        try:
+            for item in items:
+                if not _put(out, item, stop):
+                    return
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            _put(out, _DONE, stop)
+
+    def work(stage, inq, out):
+        try:
+            for item in _stream(inq, stop):
+                for result in stage(item):
+                    if out is not None and not _put(out, result, stop):
+                        return
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            if out is not None:
+                _put(out, _DONE, stop)
+
+    threads = [threading.Thread(target=feed, args=(source, queues[0]),
+                                name="pipeline-source", daemon=True)]
+    for k, stage in enumerate(stages):
+        out = queues[k + 1] if k + 1 < len(stages) else None
+        threads.append(threading.Thread(target=work,
+                                        args=(stage, queues[k], out),
+                                        name="pipeline-{}".format(k + 1),
+                                        daemon=True))
+
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        # e.g. KeyboardInterrupt while joining
+        stop.set()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Lazy loading of matplotlib for the visualizations
+#
+# The numeric modules (transform_engine, grids, interpolation, scheduling,
+# frame_store, rasterizer) never import matplotlib, and the visualization
+# modules only import it through pyplot() once a figure is actually drawn:
+# computing transforms and colors, or rendering with the raster backend,
+# starts without paying for matplotlib.
+#
+#     plotting.use_headless()  # scripts and workers without a display
+#     plt = plotting.pyplot()
+#
+# Headless rendering uses the Agg backend, selected before pyplot is loaded
+# so that no GUI toolkit is ever imported. The frames of the animations are
+# drawn on figure(), an Agg figure outside of pyplot: it never goes through
+# the canvas of an interactive backend, so it can be drawn from any thread.
+
+# switched by use_headless(), read when pyplot is loaded
+headless = False
+
+# matplotlib.pyplot once loaded
+_pyplot = None
+
+
+def use_headless():
+    """
+    Render with the Agg backend whenever pyplot is loaded (in this process)
+    """
+    global headless
+    headless = True
+    if _pyplot is not None:
+        _pyplot.switch_backend('Agg')
+
+
+def pyplot(mplot3d=False):
+    """
+    Import matplotlib.pyplot on first use
+    :param mplot3d: also register the 3D projection
+    :return: the matplotlib.pyplot module
+    """
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib
+        if headless:
+            matplotlib.use('Agg')
+        import matplotlib.pyplot
+        _pyplot = matplotlib.pyplot
+    if mplot3d:
+        import mpl_toolkits.mplot3d  # noqa: F401 registers projection='3d'
+    return _pyplot
+
+
+def figure(**kwargs):
+    """
+    Off-screen figure drawn by Agg, not managed by pyplot
+    :param kwargs: arguments of matplotlib.figure.Figure
+    :return: matplotlib.figure.Figure with an Agg canvas
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def version():
+    """
+    Version of matplotlib, e.g. to key the frames it draws
+    :return: str
+    """
+    import matplotlib
+    return matplotlib.__version__
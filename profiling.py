@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# Opt-in timing of the stages of the render pipeline
+#
+# The transform engine and the visualizations wrap their stages (matmul,
+# figure setup, drawing, png compression, encoding, ...) in stage() blocks.
+# While profiling is disabled, stage() returns a shared no-op context and
+# nothing is recorded, so the hooks cost a function call per stage.
+#
+#     profiling.enable()
+#     intermediate_plots(...)
+#     print(profiling.summary())
+#     profiling.write_trace("trace.json")  # open in chrome://tracing
+#
+# Worker processes record their own events; drain() hands them to the parent,
+# which adds them with extend().
+
+import collections
+import json
+import os
+import threading
+import time
+
+# switched by enable() and disable(), read by the hooks
+enabled = False
+
+# (stage, frame, start, end, bytes, pid, tid) tuples, times in seconds
+_events = []
+
+clock = time.perf_counter
+
+
+class _Stage:
+    """
+    Context recording the wall time of one stage
+    Set nbytes inside the block to record the bytes written by the stage.
+    """
+
+    __slots__ = ("name", "frame", "nbytes", "start")
+
+    def __init__(self, name, frame):
+        self.name = name
+        self.frame = frame
+        self.nbytes = 0
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self.start, clock(), self.frame, self.nbytes)
+
+
+class _NoStage:
+    """
+    Shared context used while profiling is disabled
+    """
+
+    nbytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_nostage = _NoStage()
+
+
+def enable():
+    """
+    Start recording stages (in this process)
+    """
+    global enabled
+    enabled = True
+
+
+def disable():
+    """
+    Stop recording stages, keeping the events recorded so far
+    """
+    global enabled
+    enabled = False
+
+
+def stage(name, frame=None):
+    """
+    Time a block of code
+    :param name: name of the stage
+    :param frame: index of the frame the stage works on, if any
+    :return: context manager
+    """
+    if not enabled:
+        return _nostage
+    return _Stage(name, frame)
+
+
+def record(name, start, end, frame=None, nbytes=0):
+    """
+    Record a stage timed by the caller (see clock)
+    :param name: name of the stage
+    :param start: start time in seconds
+    :param end: end time in seconds
+    :param frame: index of the frame, if any
+    :param nbytes: bytes written by the stage
+    """
+    if enabled:
+        _events.append((name, frame, start, end, nbytes, os.getpid(),
+                        threading.get_ident()))
+
+
+def drain():
+    """
+    Remove and return the events recorded so far
+    :return: list of event tuples
+    """
+    events = _events[:]
+    del _events[:]
+    return events
+
+
+def extend(events):
+    """
+    Add events recorded by another process
+    :param events: list of event tuples returned by drain
+    """
+    _events.extend(events)
+
+
+def summary(events=None):
+    """
+    Table of the time spent per stage
+    :param events: event tuples, all recorded events by default
+    :return: str
+    """
+    events = _events if events is None else events
+    stages = collections.OrderedDict()
+    for name, frame, start, end, nbytes, pid, tid in events:
+        stats = stages.setdefault(name, [0, 0.0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += end - start
+        stats[2] = max(stats[2], end - start)
+        stats[3] += nbytes
+
+    total = sum(stats[1] for stats in stages.values()) or 1
+    lines = ['{:<14} {:>7} {:>10} {:>10} {:>10} {:>6} {:>12}'.format(
+        'stage', 'calls', 'total s', 'mean ms', 'max ms', '%', 'bytes')]
+    for name, (calls, seconds, longest, nbytes) in stages.items():
+        lines.append('{:<14} {:>7} {:>10.3f} {:>10.3f} {:>10.3f} {:>6.1f} '
+                     '{:>12}'.format(name, calls, seconds,
+                                     1000 * seconds / calls, 1000 * longest,
+                                     100 * seconds / total, nbytes))
+    return '\n'.join(lines)
+
+
+def write_trace(filename, events=None):
+    """
+    Write the events as a Chrome trace (chrome://tracing, Perfetto)
+    Every thread gets its own track, so the overlapping stages of a
+    pipeline (see pipeline.py) show side by side.
+    :param filename: output JSON file
+    :param events: event tuples, all recorded events by default
+    """
+    events = _events if events is None else events
+    origin = min((event[2] for event in events), default=0)
+
+    trace = []
+    for name, frame, start, end, nbytes, pid, tid in events:
+        trace.append({"name": name, "ph": "X", "pid": pid, "tid": tid,
+                      "ts": 1e6 * (start - origin),
+                      "dur": 1e6 * (end - start),
+                      "args": {"frame": frame, "bytes": nbytes}})
+
+    with open(filename, 'w') as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
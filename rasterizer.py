@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# NumPy-only rasterizer for the point-grid animations
+#
+# Splats the transformed grid points straight into a preallocated RGBA
+# array, bypassing matplotlib. 3D grids are projected (orthographically or
+# in perspective) and resolved with a z-buffer; the basis and eigenvector
+# arrows are drawn on top.
+
+import functools
+
+import numpy as np
+
+# matplotlib values of the named colors used for the arrows
+NAMED_COLORS = {'red': (255, 0, 0), 'green': (0, 128, 0),
+                'blue': (0, 0, 255), 'yellow': (255, 255, 0),
+                'black': (0, 0, 0), 'white': (255, 255, 255)}
+
+
+def to_rgb(colors):
+    """
+    Convert colors to an n-by-3 uint8 array
+    :param colors: color names, or (r, g, b) / (r, g, b, a) values in [0, 1]
+    :return: n-by-3 uint8 array
+    """
+    if isinstance(colors[0], str):
+        return np.array([NAMED_COLORS[c] for c in colors], dtype=np.uint8)
+
+    colors = np.asarray(colors, dtype=np.float64).reshape(len(colors), -1)
+    return np.rint(255 * np.clip(colors[:, :3], 0, 1)).astype(np.uint8)
+
+
+def marker_radius(s, dpi):
+    """
+    Radius in pixels of a matplotlib scatter marker
+    :param s: marker size in points ** 2, as in plt.scatter
+    :param dpi: resolution of the frame
+    :return: float
+    """
+    return np.sqrt(s) / 2 / 72 * dpi
+
+
+def view_matrix(elev=30, azim=-60):
+    """
+    Rotation taking data coordinates to view coordinates
+    The defaults are the initial view angles of matplotlib's 3D axes.
+    :param elev: elevation angle in degrees
+    :param azim: azimuth angle in degrees
+    :return: 3-by-3 array whose rows are the screen x, screen y and depth
+             (towards the viewer) axes
+    """
+    elev, azim = np.radians(elev), np.radians(azim)
+    right = np.array([-np.sin(azim), np.cos(azim), 0])
+    towards = np.array([np.cos(elev) * np.cos(azim),
+                        np.cos(elev) * np.sin(azim),
+                        np.sin(elev)])
+    up = np.cross(towards, right)
+    return np.array([right, up, towards])
+
+
+def project(points, maxval, view=None, distance=None):
+    """
+    Project d-by-n points onto the screen plane
+    :param points: 2-by-n or 3-by-n array
+    :param maxval: largest coordinate, points within 1.1 * maxval are shown;
+                   in 3D, the whole cube of that half side once rotated
+    :param view: 3-by-3 view rotation (see view_matrix), 3D only
+    :param distance: viewer distance in units of maxval for a perspective
+                     projection, None for an orthographic one
+    :return: (x, y, depth) arrays, x and y scaled to [-1, 1] inside the
+             frame, depth is None for 2D points
+    """
+    extent = 1.1 * maxval
+    if points.shape[0] == 2:
+        return points[0] / extent, points[1] / extent, None
+
+    # keep the precision of the points (e.g. float32)
+    dtype = np.promote_types(points.dtype, np.float32)
+    x, y, depth = np.matmul(view.astype(dtype), points) / extent
+    if distance is not None:
+        # depth is in units of extent, 1.1 maxval, and distance of maxval
+        scale = distance / (distance - 1.1 * depth)
+        x, y = x * scale, y * scale
+
+    # the rotated corners of the cube reach up to sqrt(3) extent on the
+    # screen: fit the half width of its projection instead
+    width = np.max(np.sum(np.abs(view[:2]), axis=1))
+    return x / width, y / width, depth
+
+
+def _pixels(x, y, size):
+    """
+    Map screen coordinates in [-1, 1] to (row, column) pixel indices
+    """
+    col = np.rint((x + 1) * 0.5 * (size - 1)).astype(np.intp)
+    row = np.rint((1 - y) * 0.5 * (size - 1)).astype(np.intp)
+    return row, col
+
+
+@functools.lru_cache()
+def _disc(radius):
+    """
+    Pixel offsets of a filled disc
+    """
+    r = int(np.ceil(radius))
+    drow, dcol = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = drow ** 2 + dcol ** 2 <= radius ** 2
+    return drow[inside], dcol[inside]
+
+
+def _pack(rgb):
+    """
+    Pack n-by-3 uint8 colors into opaque 32 bit RGBA pixels
+    """
+    rgba = np.empty((len(rgb), 4), dtype=np.uint8)
+    rgba[:, :3] = rgb
+    rgba[:, 3] = 255
+    return rgba.view(np.uint32).ravel()
+
+
+def visible(x, y, size, depth=None):
+    """
+    Indices of the points that can be seen once splatted
+    Points whose centers fall on the same pixel are drawn as the same disc,
+    so only one of them shows: any one in 2D, the nearest to the viewer
+    with depth. The others are dropped, which bounds the splatting work by
+    the number of pixels instead of the number of points. Points centered
+    outside the frame are kept, their discs may still reach into it.
+    :param x: screen x coordinates in [-1, 1]
+    :param y: screen y coordinates in [-1, 1]
+    :param size: width and height of the frame in pixels
+    :param depth: depth of the points, larger is nearer
+    :return: 1D array of point indices
+    """
+    row, col = _pixels(x, y, size)
+    inside = (row >= 0) & (row < size) & (col >= 0) & (col < size)
+    index = np.flatnonzero(inside)
+    if depth is not None:
+        # nearest first, so that np.unique keeps the nearest of a pixel
+        index = index[np.argsort(-depth[index], kind='stable')]
+
+    _, first = np.unique(row[index] * size + col[index], return_index=True)
+    return np.concatenate((index[first], np.flatnonzero(~inside)))
+
+
+def splat(canvas, x, y, rgb, radius=2, depth=None, zbuffer=None):
+    """
+    Draw points as filled discs into the canvas
+    Without depth, overlapping discs cover each other in no particular
+    order. With depth, a pixel keeps the point nearest to the viewer.
+    :param canvas: height-by-width-by-4 uint8 array, modified in place
+    :param x: screen x coordinates in [-1, 1]
+    :param y: screen y coordinates in [-1, 1]
+    :param rgb: n-by-3 uint8 colors
+    :param radius: disc radius in pixels
+    :param depth: depth of the points, larger is nearer
+    :param zbuffer: preallocated array of height * width entries, of the
+                    dtype of depth
+    """
+    height, width = canvas.shape[:2]
+    pixels = canvas.view(np.uint32).reshape(-1)
+    packed = _pack(rgb)
+    row, col = _pixels(x, y, height)
+
+    # one pass per pixel of the disc keeps the temporaries O(points)
+    def stamps():
+        for drow, dcol in zip(*_disc(radius)):
+            r, c = row + drow, col + dcol
+            inside = (r >= 0) & (r < height) & (c >= 0) & (c < width)
+            yield r[inside] * width + c[inside], inside
+
+    if depth is None:
+        for index, inside in stamps():
+            pixels[index] = packed[inside]
+        return
+
+    if zbuffer is None:
+        zbuffer = np.empty(height * width, dtype=depth.dtype)
+    zbuffer.fill(-np.inf)
+    for index, inside in stamps():
+        np.maximum.at(zbuffer, index, depth[inside])
+    for index, inside in stamps():
+        front = depth[inside] >= zbuffer[index]
+        pixels[index[front]] = packed[inside][front]
+
+
+def draw_arrows(canvas, x, y, rgb, radius=1, head=0.25):
+    """
+    Draw arrows from the origin to the given screen points
+    :param canvas: height-by-width-by-4 uint8 array, modified in place
+    :param x: screen x coordinates of the arrow tips
+    :param y: screen y coordinates of the arrow tips
+    :param rgb: m-by-3 uint8 colors
+    :param radius: line half width in pixels
+    :param head: length of the arrow head relative to the arrow
+    """
+    pixel = 2 / (canvas.shape[0] - 1)
+    c, s = np.cos(np.radians(25)), np.sin(np.radians(25))
+
+    # sample the shaft and the two strokes of each head every half pixel and
+    # splat them all at once
+    xs, ys, colors = [], [], []
+    for tipx, tipy, color in zip(x, y, rgb):
+        length = np.hypot(tipx, tipy)
+        if length < pixel:
+            continue
+
+        ux, uy = tipx / length, tipy / length
+        strokes = [(0, 0, tipx, tipy)]
+        for sign in (1, -1):
+            hx = -(c * ux - sign * s * uy) * head * length
+            hy = -(sign * s * ux + c * uy) * head * length
+            strokes.append((tipx, tipy, tipx + hx, tipy + hy))
+
+        for ax, ay, bx, by in strokes:
+            n = int(np.hypot(bx - ax, by - ay) / pixel * 2) + 2
+            t = np.linspace(0, 1, n)
+            xs.append(ax + t * (bx - ax))
+            ys.append(ay + t * (by - ay))
+            colors.append(np.repeat(color[None], n, axis=0))
+
+    if xs:
+        splat(canvas, np.concatenate(xs), np.concatenate(ys),
+              np.concatenate(colors), radius=radius)
+
+
+def render_frame(grid, vector, colors, maxval, vector_colors, size=600,
+                 radius=2, background=(0, 0, 0), elev=30, azim=-60,
+                 distance=None, out=None, lod=False):
+    """
+    Rasterize one frame of the animation
+    :param grid: 2-by-n or 3-by-n array of coordinates
+    :param vector: 2-by-m or 3-by-m array of vectors drawn as arrows
+    :param colors: n-by-3 uint8 colors of the grid points (see to_rgb)
+    :param maxval: largest coordinate, sets the extent of the frame
+    :param vector_colors: m-by-3 uint8 colors of the arrows
+    :param size: width and height of the frame in pixels
+    :param radius: radius of the grid points in pixels
+    :param background: (r, g, b) uint8 background color
+    :param elev: elevation of the 3D view in degrees
+    :param azim: azimuth of the 3D view in degrees
+    :param distance: viewer distance in units of maxval for a perspective
+                     3D projection
+    :param out: preallocated size-by-size-by-4 uint8 array to draw into
+    :param lod: only splat the points that can be seen, see visible
+    :return: size-by-size-by-4 uint8 RGBA array
+    """
+    if out is None:
+        out = np.empty((size, size, 4), dtype=np.uint8)
+    # fill whole pixels at once through a 32 bit view of the RGBA bytes
+    pixel = np.array(tuple(background) + (255,), dtype=np.uint8)
+    out.view(np.uint32).fill(pixel.view(np.uint32)[0])
+
+    view = view_matrix(elev, azim) if grid.shape[0] == 3 else None
+    x, y, depth = project(grid, maxval, view, distance)
+    if lod and grid.shape[1] > 1:
+        index = visible(x, y, size, depth)
+        x, y, colors = x[index], y[index], colors[index]
+        if depth is not None:
+            depth = depth[index]
+    splat(out, x, y, colors, radius=radius, depth=depth)
+
+    x, y, _ = project(vector, maxval, view, distance)
+    draw_arrows(out, x, y, vector_colors)
+
+    return out
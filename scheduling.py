@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# Adaptive choice of the frames of an animation
+#
+# Instead of nsteps uniform steps of the interpolation parameter t, frames
+# are placed so that no point moves more than a pixel budget between two
+# consecutive frames: fast parts of the path get more frames, slow ones
+# fewer, and frames that would look identical are dropped.
+#
+# A linear map moves the points of a convex set the most at its vertices,
+# so the displacement of a whole grid is bounded by the displacement of the
+# corners of its bounding box; only those corners (and the drawn vectors)
+# are tracked along a fine sampling of the path.
+
+import numpy as np
+
+from interpolation import interpolate
+
+
+def pixel_scale(maxval, size=600):
+    """
+    Pixels per data unit of a frame, as laid out by the renderers
+    The axes span 1.1 maxval on each side of the origin.
+    :param maxval: largest coordinate of the animation
+    :param size: width of the frame in pixels
+    :return: float
+    """
+    return (size - 1) / (2.2 * maxval)
+
+
+def _corners(grid):
+    """
+    Corners of the bounding box of a d-by-n grid
+    :return: d-by-(2 ** d) array
+    """
+    low, high = np.min(grid, axis=1), np.max(grid, axis=1)
+    choice = np.indices((2,) * len(low)).reshape(len(low), -1)
+    return np.where(choice, high[:, None], low[:, None])
+
+
+def adaptive_facts(A, grid, vector=None, maxval=None, size=600, budget=6.0,
+                   mode="linear", samples=2048, tolerance=0.5):
+    """
+    Interpolation parameters keeping every step under a pixel budget
+    The path is sampled finely, then frames are chosen greedily: each frame
+    is the last sample that no point has left by more than budget pixels
+    since the previous frame. The frames always start at t = 0 and end at
+    t = 1; the last one replaces the frame before it when they would differ
+    by less than tolerance pixels, unless that frame is t = 0, so a path
+    that moves less than that still has both ends.
+    :param A: d-by-d matrix
+    :param grid: d-by-n array of coordinates
+    :param vector: optional d-by-m array of vectors, tracked too
+    :param maxval: largest coordinate of the animation, sets the pixel scale
+                   (see transform_engine.transform_max); by default the
+                   largest coordinate of the grid at both ends of the path
+    :param size: width of the frames in pixels
+    :param budget: largest displacement between consecutive frames, pixels
+    :param mode: interpolation path, see interpolation.py
+    :param samples: number of steps of the fine sampling of the path
+    :param tolerance: displacement below which frames look identical, pixels
+    :return: 1D array of increasing parameters from 0 to 1
+    """
+    points = _corners(grid)
+    if vector is not None:
+        points = np.column_stack((points, vector))
+    if maxval is None:
+        maxval = max(np.max(np.abs(grid)),
+                     np.max(np.abs(np.matmul(A, grid))))
+    scale = pixel_scale(maxval, size)
+
+    fine = np.linspace(0, 1, samples + 1)
+    # (samples + 1, d, c) positions of the tracked points, in pixels
+    track = scale * np.matmul(interpolate(A, fine, mode=mode), points)
+
+    chosen = [0]
+    while chosen[-1] < samples:
+        start = chosen[-1]
+        moved = np.max(np.linalg.norm(track[start + 1:] - track[start],
+                                      axis=1), axis=1)
+        over = np.flatnonzero(moved > budget)
+        # never less than one sample ahead, even when a sample jumps more
+        # than the budget
+        chosen.append(start + max(1, over[0]) if len(over) else samples)
+
+    # drop a frame that the last one would look identical to, but keep t = 0
+    if len(chosen) > 2:
+        moved = np.max(np.linalg.norm(track[chosen[-1]] - track[chosen[-2]],
+                                      axis=0))
+        if moved < tolerance:
+            del chosen[-2]
+
+    return fine[chosen]
+
+
+def dedupe_frames(frames, scale, tolerance=0.5):
+    """
+    Skip the frames of a stream that look identical to the previous one
+    A frame is kept when a grid point or a vector has moved by at least
+    tolerance pixels since the last kept frame; the first frame is always
+    kept. Kept frames are views of the stream's own buffers, as yielded.
+    :param frames: iterable of (grid, vector) pairs
+    :param scale: pixels per data unit (see pixel_scale)
+    :param tolerance: displacement below which frames look identical, pixels
+    :return: generator of (grid, vector) pairs
+    """
+    last = None
+    for grid, vector in frames:
+        if last is not None:
+            moved = max(np.max(np.abs(grid - last[0])),
+                        np.max(np.abs(vector - last[1])))
+            if scale * moved < tolerance:
+                continue
+        last = np.array(grid), np.array(vector)
+        yield grid, vector
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# Batched computation of the intermediate transforms used by the animations
+#
+# The visualizations of every dimension share this engine (see
+# visualization.py): the size of the identity is taken from the matrix itself.
+
+import numpy as np
+
+import profiling
+from interpolation import interpolate
+
+
+def interpolated_matrices(A, nsteps=50, dtype=None, mode="linear",
+                          facts=None):
+    """
+    Build the whole stack of intermediate matrices from I to A
+    :param A: d-by-d matrix
+    :param nsteps: number of intermediate steps
+    :param dtype: dtype of the stack (float64 by default)
+    :param mode: interpolation path, "linear" for I + t (A - I), "expm" or
+                 "polar" (see interpolation.py)
+    :param facts: interpolation parameters of the frames, replacing the
+                  nsteps + 1 uniform ones (see scheduling.adaptive_facts)
+    :return: (nsteps + 1)-by-d-by-d array, len(facts)-by-d-by-d with facts
+    """
+    with profiling.stage("interpolate"):
+        if facts is None:
+            facts = np.linspace(0, 1, nsteps + 1)
+        matrices = interpolate(A, facts, mode=mode)
+        matrices = matrices.astype(dtype or np.float64, copy=False)
+
+    return matrices
+
+
+def batched_transform(A, vector, grid, nsteps=50, out=None, mode="linear",
+                      dtype=None, facts=None):
+    """
+    Apply every intermediate matrix to the grid and to the vectors at once
+    :param A: d-by-d matrix
+    :param vector: d-by-m array of vectors
+    :param grid: d-by-n array of coordinates
+    :param nsteps: number of intermediate steps
+    :param out: optional (transgrid, transvector) pair of preallocated arrays
+                of shapes (nsteps + 1, d, n) and (nsteps + 1, d, m); their
+                dtype (e.g. float32) sets the precision of the computation
+    :param mode: interpolation path, see interpolated_matrices
+    :param dtype: dtype of the computation and of the returned stacks when
+                  out is not given (float64 by default); float32 halves the
+                  memory and bandwidth of the stacks
+    :param facts: interpolation parameters of the frames, replacing the
+                  nsteps + 1 uniform ones; the stacks then have len(facts)
+                  frames
+    :return: (transgrid, transvector)
+    """
+    if out is None:
+        out = (None, None)
+    transgrid, transvector = out
+
+    if transgrid is not None:
+        dtype = transgrid.dtype
+    dtype = dtype or np.float64
+    matrices = interpolated_matrices(A, nsteps, dtype=dtype, mode=mode,
+                                     facts=facts)
+
+    # (nsteps + 1, d, d) @ (d, n) broadcasts to (nsteps + 1, d, n): a single
+    # BLAS call per operand instead of two matmuls per frame
+    with profiling.stage("matmul"):
+        transgrid = np.matmul(matrices, np.asarray(grid, dtype=dtype),
+                              out=transgrid)
+
+        if transvector is not None:
+            dtype = transvector.dtype
+        transvector = np.matmul(matrices.astype(dtype, copy=False),
+                                np.asarray(vector, dtype=dtype),
+                                out=transvector)
+
+    return transgrid, transvector
+
+
+def iter_transform(A, vector, grid, nsteps=50, window=8, dtype=None,
+                   mode="linear", facts=None):
+    """
+    Lazily generate the intermediate transforms one frame at a time
+    Frames are computed `window` at a time into buffers that are reused, so
+    memory stays bounded by the window instead of growing with nsteps.
+    A yielded frame is only valid until the next window is computed; copy
+    it if it has to outlive the iteration step.
+    :param A: d-by-d matrix
+    :param vector: d-by-m array of vectors
+    :param grid: d-by-n array of coordinates
+    :param nsteps: number of intermediate steps
+    :param window: number of frames computed per batch (prefetch window)
+    :param dtype: dtype of the computation (float64 by default)
+    :param mode: interpolation path, see interpolated_matrices
+    :param facts: interpolation parameters of the frames, replacing the
+                  nsteps + 1 uniform ones
+    :return: generator of (d-by-n grid, d-by-m vector) pairs
+    """
+    matrices = interpolated_matrices(A, nsteps, dtype=dtype, mode=mode,
+                                     facts=facts)
+    grid = np.asarray(grid, dtype=matrices.dtype)
+    vector = np.asarray(vector, dtype=matrices.dtype)
+    nframes = len(matrices)
+
+    window = max(1, min(window, nframes))
+    gridbuf = np.empty((window,) + grid.shape, dtype=matrices.dtype)
+    vectorbuf = np.empty((window,) + vector.shape, dtype=matrices.dtype)
+
+    for start in range(0, nframes, window):
+        block = matrices[start:start + window]
+        count = block.shape[0]
+        with profiling.stage("matmul", start):
+            np.matmul(block, grid, out=gridbuf[:count])
+            np.matmul(block, vector, out=vectorbuf[:count])
+
+        for j in range(count):
+            yield gridbuf[j], vectorbuf[j]
+
+
+def _per_stage(value, count):
+    """
+    Repeat a scalar setting for every stage of a chain
+    """
+    if isinstance(value, (str, int, np.integer)):
+        return [value] * count
+    return list(value)
+
+
+def chain_products(matrices):
+    """
+    Accumulated products of a chain of matrices applied one after another
+    :param matrices: list of d-by-d matrices, applied first to last
+    :return: (k + 1)-by-d-by-d array: the identity, A1, A2 A1, ...
+    """
+    products = [np.identity(len(matrices[0]))]
+    for A in matrices:
+        products.append(np.matmul(A, products[-1]))
+    return np.array(products)
+
+
+def iter_chain(matrices, vector, grid, nsteps=50, window=8, dtype=None,
+               mode="linear"):
+    """
+    Lazily generate the frames of a chain of transformations as one stream
+    Each stage animates its own matrix starting from the grid and vectors
+    transformed by the previous stages, so a frame costs a single product
+    whatever the length of the chain. The first frame of a stage repeats
+    the last one of the previous stage and is skipped.
+    Frames reuse buffers, as with iter_transform.
+    :param matrices: list of d-by-d matrices, applied first to last
+    :param vector: d-by-m array of vectors
+    :param grid: d-by-n array of coordinates
+    :param nsteps: number of intermediate steps of every stage, or one
+                   number per stage
+    :param window: number of frames computed per batch (prefetch window)
+    :param dtype: dtype of the computation (float64 by default)
+    :param mode: interpolation path of every stage, or one per stage
+    :return: generator of (d-by-n grid, d-by-m vector) pairs,
+             sum(nsteps) + 1 frames in all
+    """
+    nsteps = _per_stage(nsteps, len(matrices))
+    modes = _per_stage(mode, len(matrices))
+
+    for k, (A, steps, stagemode) in enumerate(zip(matrices, nsteps, modes)):
+        frames = iter_transform(A, vector, grid, steps, window=window,
+                                dtype=dtype, mode=stagemode)
+        if k > 0:
+            next(frames)
+        for grid, vector in frames:
+            yield grid, vector
+
+        # the last frame is the start of the next stage; copy it out of the
+        # reused buffers
+        grid, vector = np.array(grid), np.array(vector)
+
+
+def chain_max(matrices, grid, mode="linear", nsteps=50, chunksize=65536):
+    """
+    Largest coordinate reached by the grid over a chain of transformations
+    :param matrices: list of d-by-d matrices, applied first to last
+    :param grid: d-by-n array of coordinates
+    :param mode: interpolation path of every stage, or one per stage
+    :param nsteps: number of intermediate steps of every stage, or one
+                   number per stage (non-linear paths only)
+    :param chunksize: number of points scanned at once
+    :return: float
+    """
+    nsteps = _per_stage(nsteps, len(matrices))
+    modes = _per_stage(mode, len(matrices))
+    products = chain_products(matrices)
+
+    return max(transform_max(A, np.matmul(P, grid), stagemode, steps,
+                             chunksize)
+               for A, P, steps, stagemode in zip(matrices, products, nsteps,
+                                                 modes))
+
+
+def transform_max(A, grid, mode="linear", nsteps=50, chunksize=65536,
+                  facts=None):
+    """
+    Largest coordinate reached by the grid over the whole transformation
+    On the linear path each coordinate is affine in the interpolation
+    parameter, so the maximum over all frames is attained at the first or
+    at the last one. Other paths are scanned frame by frame. Points are
+    scanned one chunk at a time, so memory-mapped grids (see loaders.py)
+    are never copied whole.
+    :param A: d-by-d matrix
+    :param grid: d-by-n array of coordinates
+    :param mode: interpolation path, see interpolated_matrices
+    :param nsteps: number of intermediate steps (non-linear paths only)
+    :param chunksize: number of points scanned at once
+    :param facts: interpolation parameters of the frames, replacing the
+                  nsteps + 1 uniform ones (non-linear paths only)
+    :return: float
+    """
+    if mode == "linear":
+        # only the first and the last frame
+        matrices = np.array([np.identity(len(A)), A])
+    else:
+        matrices = interpolated_matrices(A, nsteps, mode=mode, facts=facts)
+    return max(np.max(np.matmul(matrices, grid[:, start:start + chunksize]))
+               for start in range(0, grid.shape[1], chunksize))
+
+
+def batch_frames(frames, batchsize=4):
+    """
+    Group a stream of frames into lists of consecutive indexed frames
+    Frames are copied, so batches stay valid after the stream has reused its
+    buffers (e.g. while they wait to be sent to a worker process).
+    :param frames: iterable of (grid, vector) pairs
+    :param batchsize: number of frames per batch
+    :return: generator of lists of (index, grid, vector)
+    """
+    batch = []
+    for j, (grid, vector) in enumerate(frames):
+        batch.append((j, np.array(grid), np.array(vector)))
+        if len(batch) == batchsize:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,618 @@
+#!/usr/bin/env python3
+# Dimension-generic parts of the visualizations
+#
+# The 2D and 3D visualization modules only differ in how their figure is set
+# up and how its artists are updated (their style, setup_axes and
+# update_artists). Everything else lives here once and works for any
+# dimension: the colors of the grid, the intermediate transforms, the frame
+# sources (arrays, streams, frame stores), the raster backend, the figure
+# reused across frames with its frame cache and png output, and the pool of
+# rendering processes.
+#
+# Grids of more than 3 dimensions are projected to 3D (see projection) and
+# drawn by the 3D visualization, so every dimension goes through the same
+# optimized code path:
+#
+#     colors = colorizer(*grid)
+#     intermediate_plots(frames, None, colors, nframes=..., maxval=...)
+
+import itertools
+import multiprocessing
+import os
+
+import numpy as np
+from PIL import Image
+
+import frame_cache
+import frame_store
+import pipeline
+import plotting
+import profiling
+import rasterizer
+from transform_engine import batched_transform, batch_frames
+
+# figure reused for every frame rendered by this process
+_figure = {}
+
+# colors of the arrows, in the order of the vectors
+VECTOR_COLORS = {2: ['red', 'green', 'yellow'],
+                 3: ['red', 'green', 'blue', 'yellow']}
+
+
+def vector_colors(dim, count):
+    """
+    Colors of the arrows of count vectors, cycling through VECTOR_COLORS
+    :param dim: dimension of the frames, 2 or 3 (or more, projected to 3D)
+    :param count: number of vectors
+    :return: list of color names
+    """
+    colors = VECTOR_COLORS[min(dim, 3)]
+    return [colors[k % len(colors)] for k in range(count)]
+
+
+def projection(dim, k=3):
+    """
+    Orthonormal projection of dim-dimensional points onto k dimensions
+    The axes are spread evenly around the screen (as in the Petrie
+    projection of a hypercube), so that no axis is hidden behind another.
+    :param dim: dimension of the points
+    :param k: dimension of the projection, 2 or 3
+    :return: k-by-dim array with orthonormal rows, the identity when
+             dim <= k
+    """
+    if dim <= k:
+        return np.identity(dim)
+
+    angle = 2 * np.pi * np.arange(dim) / dim
+    rows = np.array([np.cos(angle), np.sin(angle), np.cos(2 * angle)][:k])
+    q, r = np.linalg.qr(rows.T)
+    # keep the orientation of the rows
+    return (q * np.sign(np.diag(r))).T
+
+
+def palette_xy(x, y):
+    """
+    Color channels of x-y coordinates
+    :param x: x coordinates
+    :param y: y coordinates
+    :return: (r, g, b) channels, values outside [0, 1] are clipped later
+    """
+    r = np.minimum(1, 1 - y / 4)
+    g = 1 / 4 + x / 16
+    b = np.minimum(1, 1 + y / 4)
+    return r, g, b
+
+
+def palette_xyz(x, y, z):
+    """
+    Color channels of x-y-z coordinates
+    :param x: x coordinates
+    :param y: y coordinates
+    :param z: z coordinates
+    :return: (r, g, b) channels, values outside [0, 1] are clipped later
+    """
+    r = np.minimum(1, 1 + x / 4)
+    g = np.minimum(0.25, 1 - y / 18)
+    b = np.minimum(1, 1 - z / 4)
+    return r, g, b
+
+
+def palette(*coords):
+    """
+    Default palette of any dimension
+    Points of more than 3 dimensions are colored by their projection to 3D.
+    :param coords: one array of coordinates per dimension
+    :return: (r, g, b) channels, values outside [0, 1] are clipped later
+    """
+    if len(coords) == 2:
+        return palette_xy(*coords)
+    if len(coords) > 3:
+        coords = np.matmul(projection(len(coords)), np.array(coords))
+    return palette_xyz(*coords)
+
+
+def colorizer(*coords, palette=palette, alpha=None):
+    """
+    Map coordinates to a rgb color
+    :param coords: one coordinate, or array of coordinates, per dimension
+    :param palette: function mapping coordinates to (r, g, b) channels
+    :param alpha: optional opacity, adds an alpha channel
+    :return: (r, g, b) for scalar coordinates, otherwise an n-by-3
+             (n-by-4 with alpha) float32 array
+    """
+    if all(np.ndim(c) == 0 for c in coords):
+        channels = palette(*coords) + (() if alpha is None else (alpha,))
+        return tuple(float(np.clip(c, 0, 1)) for c in channels)
+
+    coords = [np.ravel(c) for c in coords]
+    colors = np.empty((coords[0].size, 3 if alpha is None else 4),
+                      dtype=np.float32)
+    for k, channel in enumerate(palette(*coords)):
+        colors[:, k] = channel
+    if alpha is not None:
+        colors[:, 3] = alpha
+
+    return np.clip(colors, 0, 1, out=colors)
+
+
+def stepwise_transform(A, vectors, grid, nsteps=50, out=None, mode="linear",
+                       dtype=None, store=None, facts=None):
+    """
+    Generate a series of intermediate transform for the matrix multiplication
+    :param A: d-by-d matrix
+    :param vectors: d-by-m array of vectors
+    :param grid: d-by-n array of coordinates
+    :param nsteps: number of intermediate steps
+    :param out: optional (transgrid, transvector) pair of preallocated arrays
+    :param mode: interpolation path: "linear", "expm" (matrix log/exp) or
+                 "polar" (rotation + stretch)
+    :param dtype: dtype of the computation, e.g. np.float32 (float64 by
+                  default); float32 is far below a pixel at usual sizes
+    :param store: directory of a frame store to write the stacks to, block
+                  by block, for stacks that do not fit in memory (see
+                  frame_store.py); they are then returned memory mapped
+    :param facts: interpolation parameters of the frames instead of the
+                  nsteps + 1 uniform ones, e.g. scheduling.adaptive_facts
+    :return: (nsteps + 1)-by-d-by-n and (nsteps + 1)-by-d-by-m arrays
+    """
+    if store is not None:
+        return frame_store.write_frames(store, A, vectors, grid,
+                                        nsteps=nsteps, mode=mode, dtype=dtype,
+                                        facts=facts)
+    return batched_transform(A, vectors, grid, nsteps=nsteps, out=out,
+                             mode=mode, dtype=dtype, facts=facts)
+
+
+def lod_subset(grid, maxval, size, radius, oversample=4):
+    """
+    Stable subsample of a grid too dense for the pixels of its frames
+    A frame of size ** 2 pixels holds about (size / (2 radius)) ** 2 markers
+    side by side; a grid of many more points only adds overdraw. The frame
+    is binned into oversample cells per marker and each cell keeps one
+    point of the grid as projected in its frame (with the default 3D view
+    of matplotlib): in 3D the nearest to the viewer, so that the visible
+    surface is kept rather than the interior. The same subset is drawn in
+    every frame, so the colors of the points stay consistent across the
+    animation.
+    :param grid: 2-by-n or 3-by-n array of coordinates, usually the first
+                 frame
+    :param maxval: largest coordinate, to set the extent
+    :param size: width and height of the frames in pixels
+    :param radius: radius of the markers in pixels
+    :param oversample: cells per marker-sized area of the frame
+    :return: sorted 1D array of the kept point indices, None to keep every
+             point
+    """
+    cells = int(np.sqrt(oversample) * size / (2 * max(radius, 0.5)))
+    if grid.shape[1] <= cells ** 2:
+        return None
+    view = rasterizer.view_matrix() if len(grid) == 3 else None
+    x, y, depth = rasterizer.project(grid, maxval, view)
+    return np.sort(rasterizer.visible(x, y, cells, depth))
+
+
+def frame_source(transarray, transvector, nframes=None, maxval=None):
+    """
+    Frames to render, whatever form they are given in
+    :param transarray: (nsteps + 1)-by-d-by-n array, an iterator of
+                       (grid, vector) frames, or the directory of a frame
+                       store; transvector must be None for the last two
+    :param transvector: (nsteps + 1)-by-d-by-m array of vectors or None
+    :param nframes: number of frames of an iterator
+    :param maxval: largest coordinate of an iterator
+    :return: (iterable of (grid, vector) frames, nframes, maxval, store
+             directory or None)
+    """
+    store = None
+    if isinstance(transarray, str):
+        store = transarray
+        transarray, transvector = frame_store.open_frames(store)
+        frames = zip(transarray, transvector)
+        nframes = transarray.shape[0]
+        maxval = frame_store.read_meta(store)["maxval"]
+    elif transvector is None:
+        frames = transarray
+    else:
+        frames = zip(transarray, transvector)
+        nframes = transarray.shape[0]
+        maxval = transarray.max()
+
+    return frames, nframes, maxval, store
+
+
+def frame_dim(transarray, transvector):
+    """
+    Dimension of the frames and the frames themselves, peeked if needed
+    :param transarray: as in intermediate_plots
+    :param transvector: as in intermediate_plots
+    :return: (dimension, transarray) where an iterator is replaced by an
+             equivalent one
+    """
+    if isinstance(transarray, str):
+        return frame_store.open_frames(transarray)[0].shape[1], transarray
+    if transvector is not None:
+        return np.shape(transarray)[1], transarray
+
+    frames = iter(transarray)
+    first = next(frames)
+
+    def restored():
+        yield first
+        yield from frames
+
+    return len(first[0]), restored()
+
+
+def project_frames(transarray, transvector, P, nframes=None, maxval=None):
+    """
+    Project frames of more than 3 dimensions for rendering
+    :param transarray: as in intermediate_plots
+    :param transvector: as in intermediate_plots
+    :param P: k-by-d projection (see projection)
+    :param nframes: number of frames of an iterator
+    :param maxval: largest coordinate of an iterator
+    :return: (transarray, transvector, nframes, maxval) of the projected
+             frames; stacks are projected at once, other frames one at a
+             time with maxval bounded through the norm of P
+    """
+    if transvector is not None:
+        return (np.matmul(P, transarray), np.matmul(P, transvector),
+                nframes, maxval)
+
+    frames, nframes, maxval, _ = frame_source(transarray, None, nframes,
+                                              maxval)
+    P = P.astype(np.promote_types(P.dtype, np.float32), copy=False)
+    projected = ((np.matmul(P, grid), np.matmul(P, vector))
+                 for grid, vector in frames)
+    # |P x|_max <= |P|_inf |x|_max
+    return (projected, None, nframes,
+            np.abs(maxval) * np.max(np.sum(np.abs(P), axis=1)))
+
+
+def raster_frames(frames, colors, maxval, outdir, ndigits, size, radius,
+                  writer=None, lod=False):
+    """
+    Render frames with the NumPy rasterizer instead of matplotlib
+    3D grids are projected with matplotlib's default 3D view and resolved
+    with a z-buffer; no axes or panes are drawn.
+    :param frames: iterable of (grid, vector) frames of 2 or 3 dimensions
+    :param colors: color
+    :param maxval: largest coordinate, to set the extent
+    :param outdir: directory name, unused with a writer
+    :param ndigits: filename padding
+    :param size: width and height of the frames in pixels
+    :param radius: radius of the grid points in pixels
+    :param writer: animation_encoder.AnimationWriter receiving the frames
+    :param lod: only splat the points visible in each frame (see
+                rasterizer.visible)
+    """
+    rgb = rasterizer.to_rgb(colors)
+
+    canvas = color = None
+    for j, (grid, vector) in enumerate(frames):
+        if color is None:
+            color = rasterizer.to_rgb(vector_colors(len(grid),
+                                                    vector.shape[1]))
+        with profiling.stage("raster", j):
+            canvas = rasterizer.render_frame(grid, vector, rgb, maxval, color,
+                                             size=size, radius=radius,
+                                             out=canvas, lod=lod)
+        if writer is not None:
+            with profiling.stage("encode", j):
+                writer.append(canvas)
+            continue
+
+        # save as png
+        outfile = os.path.join(outdir, "frame-" + str(j + 1).
+                               zfill(ndigits) + ".png")
+        with profiling.stage("png", j) as timer:
+            Image.fromarray(canvas).save(outfile)
+            timer.nbytes = os.path.getsize(outfile)
+
+
+def _setup_figure(module, colors, maxval, outdir, ndigits, figuresize,
+                  figuredpi, cache=None, cachekey=None, subset=None,
+                  worker=True, profile=False, store=None):
+    """
+    Create the figure reused for every frame rendered by this process
+    :param module: name of the visualization module setting up the axes and
+                   drawing the artists
+    :param colors: color
+    :param maxval: largest coordinate, to set axis limits
+    :param outdir: directory name, None to keep the frames in memory
+    :param ndigits: filename padding
+    :param figuresize: size of the figure
+    :param figuredpi: resolution of the figure
+    :param cache: frame_cache.FrameCache or None
+    :param cachekey: key of the settings shared by all frames
+    :param subset: indices of the grid points drawn, None for all of them
+    :param worker: called in a worker process: render headless and switch
+                   on the style of the module for the whole process
+    :param profile: record the stages of this process (see profiling.py)
+    :param store: frame store directory mapped by this process, whose frames
+                  are then rendered by index (see _render_stored)
+    """
+    if worker:
+        plotting.use_headless()
+    draw = __import__(module)
+    if worker:
+        draw.style()
+    if profile:
+        profiling.enable()
+
+    # drawn off-screen, also on the threads of a pipeline
+    with profiling.stage("figure"):
+        fig = plotting.figure(figsize=figuresize, dpi=figuredpi,
+                              facecolor="w")
+
+    # limits, ticks and styling are fixed for the whole animation
+    with profiling.stage("axes_setup"):
+        ax = draw.setup_axes(fig, maxval)
+
+    if profiling.enabled:
+        fig.canvas.mpl_connect('draw_event', _drawn)
+
+    _figure.clear()
+    _figure.update(draw=draw, fig=fig, ax=ax, artists={}, colors=colors,
+                   outdir=outdir, ndigits=ndigits, figuredpi=figuredpi,
+                   cache=cache, cachekey=cachekey, subset=subset)
+    if store is not None:
+        _figure['store'] = frame_store.open_frames(store)
+
+
+def _drawn(event):
+    """
+    Note when the figure has been drawn, to split savefig into the drawing
+    and the png compression
+    """
+    _figure['drawn'] = profiling.clock()
+
+
+def _render_frames(batch):
+    """
+    Render a batch of frames with the figure of this process
+    The artists are created with the first frame, later frames only update
+    them (see the update_artists of the visualization modules).
+    :param batch: iterable of (index, grid, vector) frames
+    :return: list of height-by-width-by-4 RGBA frames when the figure was
+             set up without an output directory, otherwise an empty list
+    """
+    draw, fig = _figure['draw'], _figure['fig']
+    cache = _figure['cache']
+    rendered = []
+
+    for j, grid, vector in batch:  # plot individual frames
+        if _figure['subset'] is not None:
+            grid = grid[:, _figure['subset']]
+
+        outfile = None
+        if _figure['outdir'] is not None:
+            outfile = os.path.join(_figure['outdir'], "frame-" + str(j + 1).
+                                   zfill(_figure['ndigits']) + ".png")
+
+        if cache is not None:
+            with profiling.stage("cache_fetch", j):
+                key = cache.key(_figure['cachekey'], grid, vector)
+                cached = cache.fetch(key, outfile)
+            if cached is not None:
+                if outfile is None:
+                    rendered.append(cached)
+                continue
+
+        with profiling.stage("artists", j):
+            draw.update_artists(_figure['ax'], _figure['artists'], grid,
+                                vector, _figure['colors'])
+
+        if outfile is None:
+            with profiling.stage("draw", j):
+                fig.canvas.draw()
+            with profiling.stage("buffer", j) as timer:
+                rendered.append(np.array(fig.canvas.buffer_rgba()))
+                timer.nbytes = rendered[-1].nbytes
+        else:
+            # save as png
+            start = profiling.clock()
+            fig.savefig(outfile, dpi=_figure['figuredpi'],
+                        **draw.SAVEFIG_OPTIONS)
+            if profiling.enabled:
+                drawn = _figure.pop('drawn', start)
+                profiling.record("draw", start, drawn, j)
+                profiling.record("png", drawn, profiling.clock(), j,
+                                 os.path.getsize(outfile))
+
+        if cache is not None:
+            with profiling.stage("cache_store", j):
+                cache.store(key, rendered[-1] if outfile is None else outfile)
+
+    return rendered
+
+
+def _render_profiled(batch):
+    """
+    Render a batch in a worker process
+    :param batch: iterable of (index, grid, vector) frames
+    :return: (rendered frames, profiling events of the batch)
+    """
+    return _render_frames(batch), profiling.drain()
+
+
+def _render_stored(indices):
+    """
+    Render frames of the frame store mapped by this worker process
+    Only the indices are sent to the worker, the frames are read from the
+    shared pages of the store.
+    :param indices: iterable of frame indices
+    :return: (rendered frames, profiling events of the batch)
+    """
+    transgrid, transvector = _figure['store']
+    return _render_profiled([(j, transgrid[j], transvector[j])
+                             for j in indices])
+
+
+def render_pool(setup, frames, store, nframes, workers, batchsize, writer):
+    """
+    Render frames on a pool of processes, each keeping its own figure
+    Frames of a store are mapped by the workers, other frames are copied to
+    them a batch at a time.
+    :param setup: arguments of _setup_figure
+    :param frames: iterable of (grid, vector) frames
+    :param store: frame store directory or None
+    :param nframes: number of frames
+    :param workers: number of processes
+    :param batchsize: number of consecutive frames sent to a worker at once
+    :param writer: animation_encoder.AnimationWriter receiving the frames
+    """
+    if store is None:
+        render, batches = _render_profiled, batch_frames(frames, batchsize)
+    else:
+        render = _render_stored
+        batches = [range(start, min(start + batchsize, nframes))
+                   for start in range(0, nframes, batchsize)]
+
+    with multiprocessing.Pool(workers, initializer=_setup_figure,
+                              initargs=setup + (True, profiling.enabled,
+                                                store)) as pool:
+        for rendered, events in pool.imap(render, batches):
+            profiling.extend(events)
+            for rgba in rendered:
+                with profiling.stage("encode"):
+                    writer.append(rgba)
+
+
+def render_frames(frames, writer, pipelined=False, depth=4):
+    """
+    Render frames in this process with the figure already set up
+    :param frames: iterable of (grid, vector) frames
+    :param writer: animation_encoder.AnimationWriter receiving the frames
+    :param pipelined: generate, render and encode the frames concurrently
+                      on three threads (see pipeline.py) instead of one
+                      after another
+    :param depth: number of frames queued between two pipelined stages
+    """
+    if not pipelined:
+        for j, (grid, vector) in enumerate(frames):
+            for rgba in _render_frames([(j, grid, vector)]):
+                with profiling.stage("encode", j):
+                    writer.append(rgba)
+        return
+
+    def draw(batch):
+        return [(batch[0][0], rgba) for rgba in _render_frames(batch)]
+
+    def encode(item):
+        j, rgba = item
+        with profiling.stage("encode", j):
+            writer.append(rgba)
+        return ()
+
+    # batch_frames copies the frames out of the reused buffers of a stream
+    pipeline.run(batch_frames(frames, 1), draw, encode, maxsize=depth)
+
+
+def intermediate_plots(transarray, transvector, colors, outdir=None,
+                       figuresize=(4, 4), figuredpi=150, nframes=None,
+                       maxval=None, workers=1, batchsize=4, writer=None,
+                       backend="matplotlib", cache=None, pipelined=False,
+                       lod=False):
+    """
+    Generate a series of png images showing a linear transformation stepwise
+    2D and 3D frames are drawn by their visualization module; frames of
+    more than 3 dimensions are projected to 3D first (see projection).
+    While profiling is enabled, every stage is timed per frame (profiling.py).
+    :param transarray: (nsteps + 1)-by-d-by-n array to plot, or an iterator
+                       of (grid, vector) frames such as
+                       transform_engine.iter_transform, or the directory
+                       of a frame store (see frame_store.py); transvector
+                       must then be None
+    :param transvector: (nsteps + 1)-by-d-by-m array of vectors or None
+    :param colors: color, e.g. colorizer(*grid)
+    :param outdir: directory name, by default a new directory under
+                   png-frames for each run (see frame_cache.run_directory),
+                   so that no frame of an earlier run is left among them
+    :param figuresize: size of the figure
+    :param figuredpi: resolution of the figure
+    :param nframes: number of frames, required when streaming
+    :param maxval: largest coordinate, required when streaming
+                   (see transform_engine.transform_max)
+    :param workers: number of rendering processes, each keeping its own
+                    figure; 1 renders in this process
+    :param batchsize: number of consecutive frames sent to a worker at once
+    :param writer: animation_encoder.AnimationWriter receiving the frames
+                   in memory instead of saving png files to outdir
+    :param backend: "matplotlib", or "raster" to draw the points and arrows
+                    with the NumPy rasterizer (much faster, no axes)
+    :param cache: frame_cache.FrameCache reusing frames rendered before
+                  with identical content and settings (matplotlib only)
+    :param pipelined: in this process (workers=1, matplotlib), overlap the
+                      frame generation, the rendering and the encoding on
+                      threads (see pipeline.py)
+    :param lod: draw a stable subsample of grids with many more points than
+                the frames can show (see lod_subset), picked on the first
+                frame; the raster backend instead drops the hidden points
+                of each frame. Off by default, as it changes the frames
+    :return: directory of the png frames, None with a writer
+    """
+    dim, transarray = frame_dim(transarray, transvector)
+    if dim > 3:
+        transarray, transvector, nframes, maxval = project_frames(
+            transarray, transvector, projection(dim), nframes, maxval)
+        dim = 3
+    module = '{}D_visualization_v01'.format(dim)
+
+    frames, nframes, maxval, store = frame_source(transarray, transvector,
+                                                  nframes, maxval)
+
+    ndigits = len(str(nframes))  # to determine filename padding
+    maxval = np.abs(maxval)  # to set axis limits
+
+    if writer is not None:
+        outdir = None
+    elif outdir is None:
+        outdir = frame_cache.run_directory()
+    elif not os.path.exists(outdir):  # create directory if necessary
+        os.makedirs(outdir)
+
+    draw = __import__(module)
+    size = int(figuresize[0] * figuredpi)
+    radius = rasterizer.marker_radius(draw.MARKER_SIZE, figuredpi)
+    if backend == "raster":
+        raster_frames(frames, colors, maxval, outdir, ndigits, size=size,
+                      radius=radius, writer=writer, lod=lod)
+        return outdir
+
+    # grids denser than the pixels are drawn through a stable subsample
+    subset = None
+    if lod:
+        frames = iter(frames)
+        first = next(frames)
+        frames = itertools.chain([first], frames)
+        npoints = first[0].shape[1]
+        subset = lod_subset(first[0], maxval, size, radius)
+    if (subset is not None and np.ndim(colors) > 0
+            and len(colors) == npoints):
+        # colors of their own follow the points, a single color is kept
+        colors = np.asarray(colors)[subset]
+
+    cachekey = None
+    if cache is not None:
+        # the style of the module and the matplotlib drawing it decide the
+        # pixels as much as the frames do
+        cachekey = cache.key(module, np.asarray(colors), maxval, figuresize,
+                             figuredpi, outdir is None, draw.MARKER_SIZE,
+                             sorted(draw.SAVEFIG_OPTIONS.items()),
+                             VECTOR_COLORS[dim], plotting.version())
+
+    setup = (module, colors, maxval, outdir, ndigits, figuresize, figuredpi,
+             cache, cachekey, subset)
+
+    if workers > 1:
+        render_pool(setup, frames, store, nframes, workers, batchsize, writer)
+    else:
+        with draw.style():
+            _setup_figure(*setup, worker=False)
+            render_frames(frames, writer, pipelined)
+        _figure.clear()
+
+    if cache is not None:
+        cache.evict()
+    return outdir